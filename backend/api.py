@@ -3,9 +3,12 @@ CellByte Chat - FastAPI Backend
 """
 
 import os
+import shutil
 import tempfile
 from pathlib import Path
 from typing import Optional
+
+import orjson
 from dotenv import load_dotenv
 
 # Fix OpenMP conflict with FAISS on Windows
@@ -15,15 +18,23 @@ os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 load_dotenv(PROJECT_ROOT / ".env", override=True)
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Receive, Scope, Send
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
-# Add src to path for imports
+# Add src to path for imports (already present when run via the Docker PYTHONPATH)
 import sys
-sys.path.insert(0, str(Path(__file__).parent / "src"))
+SRC_DIR = str(Path(__file__).parent / "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
 
 from llm_utils import ingest_csv, get_csv_metadata, delete_file
+from llm_utils.csv_ingestion import DEFAULT_INGEST_BATCH_SIZE
+from general_utils import DATABASE_DIR, ensure_dirs
 from agent import CellByteAgent
 
 
@@ -70,8 +81,51 @@ conversations with your CSV data.
     """,
     version="0.1.0",
     openapi_tags=tags_metadata,
+    default_response_class=ORJSONResponse,
 )
 
+# Largest accepted upload, checked against Content-Length before the body is read
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+
+
+class LimitUploadSizeMiddleware:
+    """
+    Reject bad ingest requests from their headers, before the body is received.
+    
+    FastAPI parses multipart bodies before dependencies run, so oversized or
+    non-multipart uploads have to be turned away at the ASGI layer.
+    """
+    
+    def __init__(self, app: ASGIApp, path: str, max_bytes: int):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == self.path:
+            headers = dict(scope["headers"])
+            content_type = headers.get(b"content-type", b"").decode("latin-1")
+            content_length = headers.get(b"content-length")
+            
+            error = None
+            if not content_type.startswith("multipart/form-data"):
+                error = ORJSONResponse({"detail": "Expected a multipart/form-data upload"}, status_code=400)
+            elif content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+                error = ORJSONResponse(
+                    {"detail": f"Upload exceeds {self.max_bytes // (1024 * 1024)} MB limit"},
+                    status_code=413,
+                )
+            
+            if error is not None:
+                await error(scope, receive, send)
+                return
+        
+        await self.app(scope, receive, send)
+
+
+# Added before CORS so rejections still carry CORS headers
+app.add_middleware(LimitUploadSizeMiddleware, path="/files/ingest", max_bytes=MAX_UPLOAD_BYTES)
+
 # CORS middleware for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -81,6 +135,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger JSON responses (history transcripts, file listings)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+
+# File extensions accepted by /files/ingest (compared lowercased)
+ALLOWED_UPLOAD_EXTENSIONS = frozenset({".csv"})
+
+# Chunk size used when streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+
+def _copy_upload(src, dst):
+    """
+    Copy an upload's spooled file into dst.
+    
+    Once Starlette's SpooledTemporaryFile has rolled over to disk, the bytes
+    are copied in-kernel with os.copy_file_range (Linux). In-memory uploads,
+    other platforms and filesystems that refuse the syscall fall back to a
+    chunked userspace copy.
+    """
+    if hasattr(os, "copy_file_range") and getattr(src, "_rolled", False):
+        src.flush()
+        src_fd, dst_fd = src.fileno(), dst.fileno()
+        start = offset = src.tell()
+        try:
+            while copied := os.copy_file_range(src_fd, dst_fd, UPLOAD_CHUNK_SIZE, offset):
+                offset += copied
+            return
+        except OSError:
+            # Resume from wherever the kernel copy stopped
+            src.seek(offset)
+            dst.seek(offset - start)
+    
+    shutil.copyfileobj(src, dst, UPLOAD_CHUNK_SIZE)
+
 
 # =============================================================================
 # Pydantic Models
@@ -90,6 +179,8 @@ app.add_middleware(
 
 class IngestResponse(BaseModel):
     """Response after successfully ingesting a file."""
+    model_config = ConfigDict(frozen=True)
+
     status: str = Field(..., example="success")
     name: str = Field(..., example="sales_data.csv")
     description: str = Field(..., description="LLM-generated description of the file")
@@ -98,6 +189,8 @@ class IngestResponse(BaseModel):
 
 class FileMetadata(BaseModel):
     """Metadata for an ingested file."""
+    model_config = ConfigDict(frozen=True)
+
     name: str
     date_ingested: str
     description: str
@@ -109,11 +202,15 @@ class FileMetadata(BaseModel):
 
 class FilesListResponse(BaseModel):
     """List of all ingested files."""
+    model_config = ConfigDict(frozen=True)
+
     files: list[dict]
 
 
 class DeleteResponse(BaseModel):
     """Response after deleting a file."""
+    model_config = ConfigDict(frozen=True)
+
     status: str = Field(..., example="deleted")
     name: str
     remaining_files: int
@@ -123,6 +220,8 @@ class DeleteResponse(BaseModel):
 
 class ChatMessage(BaseModel):
     """A single message in the chat history."""
+    model_config = ConfigDict(frozen=True)
+
     role: str = Field(..., description="Role: 'user', 'assistant', or 'tool'")
     content: str = Field(..., description="Message content")
     tool_calls: Optional[list] = Field(None, description="Tool calls made by assistant")
@@ -131,12 +230,27 @@ class ChatMessage(BaseModel):
 
 class ChatRequest(BaseModel):
     """Request body for chat endpoint."""
+    model_config = ConfigDict(frozen=True)
+
     message: str = Field(..., description="The user's message", example="What products have the highest sales?")
-    history: Optional[list[ChatMessage]] = Field(None, description="Previous conversation history")
+    # Plain dicts in the ChatMessage shape; the agent is the authority on their
+    # structure, so per-message validation on every turn is skipped.
+    history: Optional[list[dict]] = Field(None, description="Previous conversation history (ChatMessage objects)")
+
+    @field_validator("history")
+    @classmethod
+    def _check_history_shape(cls, history: Optional[list[dict]]) -> Optional[list[dict]]:
+        # Only the fields every ChatMessage requires, so bad input is a 422
+        for i, msg in enumerate(history or ()):
+            if not isinstance(msg.get("role"), str) or not isinstance(msg.get("content"), str):
+                raise ValueError(f"history[{i}] needs string 'role' and 'content' fields")
+        return history
 
 
 class ChatResponse(BaseModel):
     """Response from chat endpoint."""
+    model_config = ConfigDict(frozen=True)
+
     response: str = Field(..., description="The agent's response")
     history: list = Field(..., description="Updated conversation history including tool calls")
 
@@ -181,18 +295,43 @@ async def chat(request: ChatRequest):
     transparency into what the agent did to generate its response.
     """
     try:
-        history = None
-        if request.history:
-            history = [msg.model_dump(exclude_none=True) for msg in request.history]
-        
-        response, updated_history = agent.chat(request.message, history=history)
+        response, updated_history = await agent.achat(
+            request.message, history=request.history or None
+        )
         
-        return ChatResponse(response=response, history=updated_history)
+        # Return the response directly so the transcript isn't re-validated
+        return ORJSONResponse({"response": response, "history": updated_history})
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error in chat: {str(e)}")
 
 
+@app.post("/chat/stream", tags=["Chat"])
+async def chat_stream(request: ChatRequest):
+    """
+    Chat with the AI agent, streaming the response as Server-Sent Events.
+    
+    Each event's `data` is a JSON object:
+    - `{"type": "token", "content": "..."}` for each generated response token
+    - `{"type": "done", "response": "...", "history": [...]}` once finished
+    - `{"type": "error", "detail": "..."}` if the agent fails mid-stream
+    """
+    async def event_stream():
+        try:
+            async for event in agent.astream_chat(request.message, history=request.history or None):
+                yield b"data: " + orjson.dumps(event) + b"\n\n"
+        except Exception as e:
+            error = {"type": "error", "detail": f"Error in chat: {str(e)}"}
+            yield b"data: " + orjson.dumps(error) + b"\n\n"
+    
+    # Content-Encoding: identity keeps GZipMiddleware from buffering the stream
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Content-Encoding": "identity"},
+    )
+
+
 @app.post("/chat/refresh", tags=["Chat"])
 async def refresh_agent():
     """
@@ -203,7 +342,7 @@ async def refresh_agent():
     the latest file descriptions.
     """
     try:
-        agent.refresh_metadata()
+        await run_in_threadpool(agent.refresh_metadata)
         return {
             "status": "ok", 
             "message": "Agent metadata refreshed",
@@ -218,7 +357,14 @@ async def refresh_agent():
 # =============================================================================
 
 @app.post("/files/ingest", response_model=IngestResponse, tags=["Files"])
-async def ingest_csv_file(file: UploadFile = File(..., description="CSV file to ingest")):
+async def ingest_csv_file(
+    file: UploadFile = File(..., description="CSV file to ingest"),
+    batch_size: int = Query(
+        DEFAULT_INGEST_BATCH_SIZE,
+        ge=1,
+        description="Rows embedded per batch; lower it to reduce peak memory",
+    ),
+):
     """
     Upload and ingest a CSV file.
     
@@ -226,21 +372,27 @@ async def ingest_csv_file(file: UploadFile = File(..., description="CSV file to
     1. Generates an LLM-powered description of the CSV
     2. Creates embeddings for semantic search
     3. Stores vectors in FAISS vectorstore
-    4. Saves metadata to csv_metadata.json
+    4. Saves metadata to the metadata database
     
     **Note:** After ingesting, call `/chat/refresh` to update the agent.
     """
-    if not file.filename.endswith(".csv"):
+    extension = os.path.splitext(file.filename or "")[1].lower()
+    if extension not in ALLOWED_UPLOAD_EXTENSIONS:
         raise HTTPException(status_code=400, detail="Only CSV files are supported")
     
     tmp_path = None
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp:
-            content = await file.read()
-            tmp.write(content)
+        # Stream the upload to disk in chunks instead of buffering it in memory.
+        # Stage it next to the files directory so ingestion can move it into
+        # place with a rename rather than writing the bytes a second time.
+        ensure_dirs()
+        with tempfile.NamedTemporaryFile(delete=False, suffix=extension, dir=DATABASE_DIR) as tmp:
             tmp_path = tmp.name
+            await run_in_threadpool(_copy_upload, file.file, tmp)
         
-        result = ingest_csv(tmp_path, filename=file.filename)
+        result = await run_in_threadpool(
+            ingest_csv, tmp_path, filename=file.filename, move=True, batch_size=batch_size
+        )
         return IngestResponse(**result)
     
     except Exception as e:
@@ -261,7 +413,7 @@ async def list_files():
     - Row count and column names
     - Statistical summary
     """
-    metadata = get_csv_metadata()
+    metadata = await run_in_threadpool(get_csv_metadata)
     return FilesListResponse(files=metadata.get("files", []))
 
 
@@ -271,13 +423,13 @@ async def delete_csv_file(filename: str):
     Delete an ingested file.
     
     This will:
-    1. Remove the file's metadata from csv_metadata.json
+    1. Remove the file's metadata from the metadata database
     2. Rebuild the FAISS vectorstore without this file's vectors
     
     **Note:** After deleting, call `/chat/refresh` to update the agent.
     """
     try:
-        result = delete_file(filename)
+        result = await run_in_threadpool(delete_file, filename)
         return DeleteResponse(**result)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -295,6 +447,8 @@ HISTORY_DIR.mkdir(exist_ok=True)
 
 class ChatHistoryModel(BaseModel):
     """A saved chat history."""
+    model_config = ConfigDict(frozen=True)
+
     id: str
     title: str
     created_at: str
@@ -302,29 +456,60 @@ class ChatHistoryModel(BaseModel):
     messages: list
 
 
-@app.get("/history", tags=["History"])
-async def list_histories():
-    """
-    List all saved chat histories.
-    """
-    import json
-    histories = []
+def _history_summary(data: dict) -> dict:
+    """Extract the fields returned by the history listing."""
+    return {
+        "id": data.get("id"),
+        "title": data.get("title", "Untitled"),
+        "created_at": data.get("created_at"),
+        "updated_at": data.get("updated_at"),
+    }
+
+
+def _read_history_file(file_path: Path) -> dict:
+    """Read and parse a saved history file."""
+    with open(file_path, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+def _write_history_file(file_path: Path, data: dict):
+    """Serialize and write a history file."""
+    with open(file_path, 'wb') as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+
+
+def _build_history_index() -> dict[str, dict]:
+    """Scan HISTORY_DIR once and return summaries keyed by history ID."""
+    index = {}
     
     for file in HISTORY_DIR.glob("*.json"):
         try:
-            with open(file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                histories.append({
-                    "id": data.get("id"),
-                    "title": data.get("title", "Untitled"),
-                    "created_at": data.get("created_at"),
-                    "updated_at": data.get("updated_at"),
-                })
+            index[file.stem] = _history_summary(_read_history_file(file))
         except Exception:
             continue
     
-    histories.sort(key=lambda x: x.get("updated_at", ""), reverse=True)
-    return histories
+    return index
+
+
+# In-memory summaries of saved histories, kept in sync by save/delete
+HISTORY_INDEX = _build_history_index()
+
+
+@app.get("/history", tags=["History"])
+async def list_histories(
+    limit: Optional[int] = Query(None, ge=1, description="Maximum histories to return (default: all)"),
+    offset: int = Query(0, ge=0, description="Number of most-recent histories to skip"),
+):
+    """
+    List saved chat histories, most recently updated first.
+    """
+    histories = sorted(
+        HISTORY_INDEX.values(),
+        key=lambda x: x.get("updated_at") or "",
+        reverse=True,
+    )
+    end = offset + limit if limit is not None else None
+    return histories[offset:end]
 
 
 @app.get("/history/{history_id}", tags=["History"])
@@ -332,14 +517,13 @@ async def get_history(history_id: str):
     """
     Get a specific chat history by ID.
     """
-    import json
     file_path = HISTORY_DIR / f"{history_id}.json"
     
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="History not found")
     
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    # Serve the stored JSON as-is rather than parsing and re-encoding it
+    return FileResponse(file_path, media_type="application/json")
 
 
 @app.put("/history/{history_id}", tags=["History"])
@@ -347,12 +531,12 @@ async def save_history(history_id: str, history: ChatHistoryModel):
     """
     Save or update a chat history.
     """
-    import json
     file_path = HISTORY_DIR / f"{history_id}.json"
     
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(history.model_dump(), f, indent=2, ensure_ascii=False)
+    data = history.model_dump()
+    await run_in_threadpool(_write_history_file, file_path, data)
     
+    HISTORY_INDEX[history_id] = _history_summary(data)
     return {"status": "saved", "id": history_id}
 
 
@@ -367,6 +551,7 @@ async def delete_history(history_id: str):
         raise HTTPException(status_code=404, detail="History not found")
     
     file_path.unlink()
+    HISTORY_INDEX.pop(history_id, None)
     return {"status": "deleted", "id": history_id}
 
 
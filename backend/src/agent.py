@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Optional
 from dotenv import load_dotenv
 
 # Fix OpenMP conflict with FAISS on Windows
@@ -10,16 +10,134 @@ os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 load_dotenv(PROJECT_ROOT / ".env", override=True)
 
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
-from langgraph.prebuilt import create_react_agent
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, SystemMessage, ToolMessage
 
-from llm_utils.csv_ingestion import get_csv_metadata
-from general_utils import get_logger
+# langgraph and the llm_utils modules (FAISS, pandas, langchain_openai) are
+# imported where first needed, so importing this module stays cheap
+from general_utils import get_logger, format_sample_preview
 
 logger = get_logger("agent")
 
 
+# Invariant part of the system prompt. It comes first and stays byte-identical
+# across turns and refreshes so OpenAI's automatic prompt (prefix) caching hits;
+# the per-file section is appended after it.
+_PROMPT_STATIC = """You are CellByte, an intelligent data assistant that helps users explore and analyze CSV data.
+
+## Your Tools
+
+1. **`search_data`**: Semantic search to find specific rows/records.
+   - Use for: "find drugs with...", "show me entries where...", "look up..."
+   - Returns: Sample rows matching the query
+
+2. **`search_data_batch`**: Several semantic searches in one call (up to 8 queries).
+   - Use for: looking up multiple different things at once instead of repeated `search_data` calls
+   - Returns: Sample rows per query
+
+3. **`analyze_data`**: Statistical analysis and calculations on data.
+   - Use for: mean, median, sum, count, min, max, std, correlations, group by, value counts
+   - Use for: "what is the average...", "calculate the median...", "how many...", "compare..."
+   - Returns: Computed statistics and numerical results
+
+4. **`create_plot`**: Generate visualizations.
+   - Use for: charts, graphs, plots, distributions, visualizations
+   - Returns: Interactive Plotly chart
+
+## Guidelines
+
+- **ALWAYS use tools** when users ask about data. DO NOT guess or calculate manually.
+- **For calculations/statistics → use `analyze_data`**, NOT `search_data`.
+- **Fuzzy column matching**: "yearly therapy costs" → `yearly_price_avg_today_apu`, "benefit rating" → `additional_benefit`.
+- **IMPORTANT for plots**: When `create_plot` succeeds, DO NOT echo `[PLOT_JSON]` tags. The plot displays automatically.
+- Be precise and cite which file the information comes from.
+- Be conversational and helpful.
+"""
+
+_FILES_HEADER = """
+## Available Data Files
+
+"""
+
+
+def _format_file_entry(i: int, f: dict) -> str:
+    """Format one file's metadata as a numbered entry for the system prompt."""
+    # Sample data is pre-formatted at ingestion; older metadata only has head_5
+    sample_str = f.get("sample_preview")
+    if sample_str is None:
+        sample_str = format_sample_preview(f.get("head_5", []))
+    if sample_str:
+        sample_section = f"\n   Sample data:\n{sample_str}"
+    else:
+        sample_section = ""
+    
+    # Show ALL columns
+    all_columns = f.get('columns', [])
+    columns_str = ', '.join(all_columns)
+    description = f['description']
+    
+    return (
+        f"{i}. **{f['name']}** ({f.get('row_count', '?')} rows, {len(all_columns)} columns)\n"
+        f"   Columns: {columns_str}\n"
+        f"   {description[:500]}{'...' if len(description) > 500 else ''}"
+        f"{sample_section}"
+    )
+
+
+# =============================================================================
+# History <-> LangChain message conversion
+# =============================================================================
+
+def _ai_from_dict(msg: dict) -> AIMessage:
+    # Reconstruct AIMessage with tool_calls if present
+    if msg.get("tool_calls"):
+        return AIMessage(content=msg.get("content", ""), tool_calls=msg["tool_calls"])
+    return AIMessage(content=msg["content"])
+
+
+def _ai_to_dict(msg: AIMessage) -> dict:
+    entry = {"role": "assistant", "content": msg.content}
+    if msg.tool_calls:
+        entry["tool_calls"] = msg.tool_calls
+        logger.info(f"Tool calls in response: {[tc['name'] for tc in msg.tool_calls]}")
+    return entry
+
+
+def _tool_to_dict(msg: ToolMessage) -> dict:
+    logger.debug(f"Tool result received (id: {msg.tool_call_id}): {msg.content[:200]}...")
+    return {"role": "tool", "tool_call_id": msg.tool_call_id, "content": msg.content}
+
+
+# History dict role -> LangChain message constructor
+_FROM_DICT = {
+    "user": lambda msg: HumanMessage(content=msg["content"]),
+    "assistant": _ai_from_dict,
+    "tool": lambda msg: ToolMessage(content=msg["content"], tool_call_id=msg["tool_call_id"]),
+}
+
+# LangChain message type -> history dict serializer, looked up by exact type
+_TO_DICT = {
+    HumanMessage: lambda msg: {"role": "user", "content": msg.content},
+    AIMessage: _ai_to_dict,
+    ToolMessage: _tool_to_dict,
+}
+
+
+def _to_dict_for(msg_type: type):
+    """Return the serializer for a message type, resolving subclasses once."""
+    try:
+        return _TO_DICT[msg_type]
+    except KeyError:
+        pass
+    # Subclasses (e.g. AIMessageChunk) map to their base's serializer;
+    # anything else (e.g. SystemMessage) is recorded as None and skipped
+    to_dict = next(
+        (fn for base, fn in list(_TO_DICT.items()) if issubclass(msg_type, base)),
+        None,
+    )
+    _TO_DICT[msg_type] = to_dict
+    return to_dict
+
+
 class CellByteAgent:
     """
     An agentic chatbot that can query CSV data using RAG.
@@ -35,13 +153,17 @@ class CellByteAgent:
         
         Args:
             metadata: List of dicts with 'name' and 'description' keys.
-                     If None, loads from csv_metadata.json
+                     If None, loads from the metadata database
         """
         logger.info("Initializing CellByteAgent...")
+        from langgraph.prebuilt import create_react_agent
+        from llm_utils.clients import CHAT_MODEL, get_chat_model
+        from llm_utils.csv_ingestion import get_csv_metadata
+        from llm_utils.tools import ALL_TOOLS
         
         # Load metadata if not provided
         if metadata is None:
-            logger.debug("Loading metadata from csv_metadata.json")
+            logger.debug("Loading metadata from the metadata database")
             full_metadata = get_csv_metadata()
             metadata = [
                 {
@@ -50,6 +172,7 @@ class CellByteAgent:
                     "columns": f.get("columns", []),
                     "row_count": f.get("row_count", 0),
                     "head_5": f.get("head_5", []),
+                    "sample_preview": f.get("sample_preview"),
                 }
                 for f in full_metadata.get("files", [])
             ]
@@ -59,96 +182,90 @@ class CellByteAgent:
         self.system_prompt = self._build_system_prompt()
         logger.debug(f"System prompt built ({len(self.system_prompt)} chars)")
         
-        # Create the LLM
-        model_name = "gpt-5.1"
-        logger.info(f"Creating LLM with model: {model_name}")
+        # Use the shared LLM client so its connection pool outlives this agent
+        logger.info(f"Creating LLM with model: {CHAT_MODEL}")
         try:
-            self.llm = ChatOpenAI(model=model_name, temperature=0)
+            self.llm = get_chat_model()
             logger.info("LLM created successfully")
         except Exception as e:
             logger.error(f"Failed to create LLM: {e}")
             raise
         
-        # Tools available to the agent
-        from llm_utils.tools import search_data, analyze_data, create_plot
-        self.tools = [search_data, analyze_data, create_plot]
+        # Tools available to the agent (the single list defined in llm_utils.tools)
+        self.tools = list(ALL_TOOLS)
         logger.info(f"Loaded {len(self.tools)} tools: {[t.name for t in self.tools]}")
         
-        # Create the ReAct agent
+        # Create the ReAct agent once. The prompt is a callable that reads
+        # self.system_prompt at invoke time, so refreshes don't rebuild the graph.
         try:
             self.agent = create_react_agent(
                 self.llm,
                 tools=self.tools,
-                prompt=self.system_prompt,
+                prompt=self._prompt,
             )
             logger.info("ReAct agent created successfully")
         except Exception as e:
             logger.error(f"Failed to create ReAct agent: {e}")
             raise
     
+    def _prompt(self, state: dict) -> list:
+        """Prepend the current system prompt to the graph's messages."""
+        return [SystemMessage(content=self.system_prompt)] + state["messages"]
+    
     def _build_system_prompt(self) -> str:
         """Build the system prompt with file metadata context."""
-        
         if not self.metadata:
             files_context = "No files have been ingested yet."
         else:
-            files_list = []
-            for i, f in enumerate(self.metadata, 1):
-                # Format head_5 as sample data
-                head_5 = f.get("head_5", [])
-                if head_5:
-                    columns = list(head_5[0].keys()) if head_5 else []
-                    sample_rows = []
-                    for row in head_5[:3]:  # Show first 3 rows
-                        row_str = " | ".join([str(row.get(c, ""))[:15] for c in columns[:5]])  # First 5 cols
-                        sample_rows.append(f"      {row_str}")
-                    sample_str = "\n".join(sample_rows)
-                    sample_section = f"\n   Sample data:\n{sample_str}"
-                else:
-                    sample_section = ""
-                
-                # Show ALL columns
-                all_columns = f.get('columns', [])
-                columns_str = ', '.join(all_columns)
-                
-                files_list.append(
-                    f"{i}. **{f['name']}** ({f.get('row_count', '?')} rows, {len(all_columns)} columns)\n"
-                    f"   Columns: {columns_str}\n"
-                    f"   {f['description'][:500]}{'...' if len(f['description']) > 500 else ''}"
-                    f"{sample_section}"
-                )
-            files_context = "\n\n".join(files_list)
+            files_context = "\n\n".join(
+                _format_file_entry(i, f) for i, f in enumerate(self.metadata, 1)
+            )
         
-        return f"""You are CellByte, an intelligent data assistant that helps users explore and analyze CSV data.
-
-## Available Data Files
-
-{files_context}
-
-## Your Tools
-
-1. **`search_data`**: Semantic search to find specific rows/records.
-   - Use for: "find drugs with...", "show me entries where...", "look up..."
-   - Returns: Sample rows matching the query
-
-2. **`analyze_data`**: Statistical analysis and calculations on data.
-   - Use for: mean, median, sum, count, min, max, std, correlations, group by, value counts
-   - Use for: "what is the average...", "calculate the median...", "how many...", "compare..."
-   - Returns: Computed statistics and numerical results
-
-3. **`create_plot`**: Generate visualizations.
-   - Use for: charts, graphs, plots, distributions, visualizations
-   - Returns: Interactive Plotly chart
-
-## Guidelines
-
-- **ALWAYS use tools** when users ask about data. DO NOT guess or calculate manually.
-- **For calculations/statistics → use `analyze_data`**, NOT `search_data`.
-- **Fuzzy column matching**: "yearly therapy costs" → `yearly_price_avg_today_apu`, "benefit rating" → `additional_benefit`.
-- **IMPORTANT for plots**: When `create_plot` succeeds, DO NOT echo `[PLOT_HTML]` tags. The plot displays automatically.
-- Be precise and cite which file the information comes from.
-- Be conversational and helpful.
-"""
+        return "".join((_PROMPT_STATIC, _FILES_HEADER, files_context, "\n"))
+    
+    def _build_messages(self, message: str, history: Optional[list[dict]]) -> list:
+        """Convert history dicts plus the new user message into LangChain messages."""
+        logger.info(f"Chat received message: {message[:100]}{'...' if len(message) > 100 else ''}")
+        logger.debug(f"History length: {len(history) if history else 0}")
+        
+        # Build messages list from history (unknown roles are skipped)
+        messages = []
+        for msg in history or ():
+            from_dict = _FROM_DICT.get(msg.get("role"))
+            if from_dict is not None:
+                messages.append(from_dict(msg))
+        
+        # Add current message
+        messages.append(HumanMessage(content=message))
+        logger.debug(f"Total messages to send: {len(messages)}")
+        return messages
+    
+    def _build_result(
+        self,
+        result: dict,
+        messages: list,
+        history: Optional[list[dict]],
+    ) -> tuple[str, list[dict]]:
+        """
+        Extract the final response from an agent result and append this turn's
+        messages to history in place (a new list is created if history is None).
+        """
+        logger.info(f"Agent returned {len(result['messages'])} messages")
+        
+        # Append only the new messages; the caller's list is extended, not copied
+        new_history = history if history is not None else []
+        start_idx = len(messages) - 1  # Start from the new user message
+        
+        for msg in result["messages"][start_idx:]:
+            to_dict = _to_dict_for(type(msg))
+            if to_dict is not None:
+                new_history.append(to_dict(msg))
+        
+        # Extract final response
+        final_message = result["messages"][-1]
+        logger.info(f"Final response: {final_message.content[:100]}{'...' if len(final_message.content) > 100 else ''}")
+        
+        return final_message.content, new_history
     
     def chat(self, message: str, history: Optional[list[dict]] = None) -> tuple[str, list[dict]]:
         """
@@ -163,97 +280,139 @@ class CellByteAgent:
                         {"role": "tool", "tool_call_id": "...", "content": "..."},
                         ...
                     ]
+                    The list is extended in place with this turn's messages.
                     
         Returns:
-            Tuple of (response_string, updated_history)
+            Tuple of (response_string, updated_history), where updated_history
+            is the same list object as history when one was passed
         """
-        logger.info(f"Chat received message: {message[:100]}{'...' if len(message) > 100 else ''}")
-        logger.debug(f"History length: {len(history) if history else 0}")
-        
-        # Build messages list from history
-        messages = []
-        
-        if history:
-            for msg in history:
-                if msg["role"] == "user":
-                    messages.append(HumanMessage(content=msg["content"]))
-                elif msg["role"] == "assistant":
-                    # Reconstruct AIMessage with tool_calls if present
-                    if msg.get("tool_calls"):
-                        messages.append(AIMessage(
-                            content=msg.get("content", ""),
-                            tool_calls=msg["tool_calls"]
-                        ))
-                    else:
-                        messages.append(AIMessage(content=msg["content"]))
-                elif msg["role"] == "tool":
-                    messages.append(ToolMessage(
-                        content=msg["content"],
-                        tool_call_id=msg["tool_call_id"]
-                    ))
-        
-        # Add current message
-        messages.append(HumanMessage(content=message))
-        logger.debug(f"Total messages to send: {len(messages)}")
+        messages = self._build_messages(message, history)
         
         # Invoke the agent
         try:
             logger.info("Invoking agent...")
             result = self.agent.invoke({"messages": messages})
-            logger.info(f"Agent returned {len(result['messages'])} messages")
         except Exception as e:
             logger.error(f"Agent invocation failed: {e}", exc_info=True)
             raise
         
-        # Build updated history from all new messages (skip messages already in history)
-        new_history = history.copy() if history else []
-        start_idx = len(messages) - 1  # Start from the new user message
+        return self._build_result(result, messages, history)
+    
+    async def achat(self, message: str, history: Optional[list[dict]] = None) -> tuple[str, list[dict]]:
+        """
+        Async version of chat() that awaits the agent without blocking the event loop.
         
-        for msg in result["messages"][start_idx:]:
-            if isinstance(msg, HumanMessage):
-                new_history.append({"role": "user", "content": msg.content})
-            elif isinstance(msg, AIMessage):
-                entry = {"role": "assistant", "content": msg.content}
-                if hasattr(msg, 'tool_calls') and msg.tool_calls:
-                    entry["tool_calls"] = msg.tool_calls
-                    logger.info(f"Tool calls in response: {[tc['name'] for tc in msg.tool_calls]}")
-                new_history.append(entry)
-            elif isinstance(msg, ToolMessage):
-                logger.debug(f"Tool result received (id: {msg.tool_call_id}): {msg.content[:200]}...")
-                new_history.append({
-                    "role": "tool",
-                    "tool_call_id": msg.tool_call_id,
-                    "content": msg.content
-                })
+        Args:
+            message: The user's message
+            history: Optional list of previous messages (same format as chat()),
+                    extended in place with this turn's messages
+            
+        Returns:
+            Tuple of (response_string, updated_history)
+        """
+        messages = self._build_messages(message, history)
         
-        # Extract final response
-        final_message = result["messages"][-1]
-        logger.info(f"Final response: {final_message.content[:100]}{'...' if len(final_message.content) > 100 else ''}")
+        try:
+            logger.info("Invoking agent (async)...")
+            result = await self.agent.ainvoke({"messages": messages})
+        except Exception as e:
+            logger.error(f"Agent invocation failed: {e}", exc_info=True)
+            raise
         
-        return final_message.content, new_history
+        return self._build_result(result, messages, history)
+    
+    async def astream_chat(
+        self,
+        message: str,
+        history: Optional[list[dict]] = None,
+    ) -> AsyncIterator[dict]:
+        """
+        Stream the agent's reply as it is generated.
+        
+        Args:
+            message: The user's message
+            history: Optional list of previous messages (same format as chat()),
+                    extended in place once the reply is complete
+            
+        Yields:
+            {"type": "token", "content": str} for each response token, then a
+            final {"type": "done", "response": str, "history": list[dict]}
+        """
+        messages = self._build_messages(message, history)
+        result = None
+        tokens: list[str] = []
+        
+        try:
+            logger.info("Streaming agent...")
+            async for mode, chunk in self.agent.astream(
+                {"messages": messages},
+                stream_mode=["messages", "values"],
+            ):
+                if mode == "values":
+                    result = chunk
+                    continue
+                
+                # Only forward tokens from the agent's own LLM, not LLM calls
+                # made inside tools (analytics/plot code generation)
+                token, meta = chunk
+                if meta.get("langgraph_node") == "agent" and isinstance(token, AIMessageChunk) and token.content:
+                    tokens.append(token.content)
+                    yield {"type": "token", "content": token.content}
+        except Exception as e:
+            logger.error(f"Agent streaming failed: {e}", exc_info=True)
+            raise
+        
+        if result is None:
+            # The graph ended without a state snapshot; fall back to the
+            # streamed text so the turn is still recorded
+            if not tokens:
+                raise RuntimeError("Agent stream ended without a response")
+            logger.warning("Agent stream ended without a final state; using streamed tokens")
+            response = "".join(tokens)
+            new_history = history if history is not None else []
+            new_history.append({"role": "user", "content": message})
+            new_history.append({"role": "assistant", "content": response})
+            yield {"type": "done", "response": response, "history": new_history}
+            return
+        
+        response, new_history = self._build_result(result, messages, history)
+        yield {"type": "done", "response": response, "history": new_history}
+    
+    def invalidate_rag_cache(self):
+        """Drop cached search_data results so the next searches hit FAISS."""
+        from llm_utils.query_cache import invalidate_search_caches
+        invalidate_search_caches()
     
     def refresh_metadata(self):
-        """Reload metadata from csv_metadata.json and rebuild system prompt."""
+        """Reload metadata from the metadata database and rebuild system prompt."""
         logger.info("Refreshing metadata...")
+        from llm_utils.csv_ingestion import get_csv_metadata
+        from llm_utils.query_cache import invalidate_search_caches
+        
+        # The shared vectorstore already follows ingests in this process (in
+        # memory) and index rewrites by others (on disk), so it is kept
+        # resident; only cached search results are dropped
+        invalidate_search_caches()
         full_metadata = get_csv_metadata()
-        self.metadata = [
+        metadata = [
             {
                 "name": f["name"], 
                 "description": f.get("description", ""),
                 "columns": f.get("columns", []),
                 "row_count": f.get("row_count", 0),
                 "head_5": f.get("head_5", []),
+                "sample_preview": f.get("sample_preview"),
             }
             for f in full_metadata.get("files", [])
         ]
-        self.system_prompt = self._build_system_prompt()
         
-        # Recreate agent with new system prompt
-        self.agent = create_react_agent(
-            self.llm,
-            tools=self.tools,
-            prompt=self.system_prompt,
-        )
+        if metadata == self.metadata:
+            logger.info("Metadata unchanged, keeping current system prompt")
+            return
+        
+        # The agent reads self.system_prompt on every invoke, so no rebuild is needed
+        self.metadata = metadata
+        self.system_prompt = self._build_system_prompt()
         logger.info(f"Metadata refreshed. {len(self.metadata)} files loaded.")
 
 
@@ -267,7 +426,8 @@ if __name__ == "__main__":
             if not user_input:
                 continue
             
-            response, history = agent.chat(user_input, history=history)
+            # history is extended in place with the new turn
+            response, _ = agent.chat(user_input, history=history)
             print(f"Agent: {response}\n")
             
         except KeyboardInterrupt:
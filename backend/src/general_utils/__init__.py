@@ -5,17 +5,30 @@ from .file_utils import (
     DATABASE_DIR,
     FAISS_DIR,
     FILES_DIR,
+    PARQUET_DIR,
+    METADATA_DB,
     METADATA_FILE,
     ensure_dirs,
     # File reading
     detect_delimiter,
     read_tabular_file,
+    STREAM_MIN_BYTES,
+    should_stream,
+    read_tabular_chunks,
     # Dataset loading
     load_dataset,
+    write_parquet_mirror,
+    fresh_parquet_mirror,
+    remove_parquet_mirror,
+    read_mirror_if_identical,
     list_available_files,
     # Dataset context for LLM
+    STATS_SAMPLE_ROWS,
     get_dataset_context,
     format_context_for_prompt,
+    get_formatted_context,
+    clear_context_cache,
+    format_sample_preview,
     # Column utilities
     get_column_names,
     get_numeric_columns,
@@ -31,17 +44,30 @@ __all__ = [
     "DATABASE_DIR",
     "FAISS_DIR",
     "FILES_DIR",
+    "PARQUET_DIR",
+    "METADATA_DB",
     "METADATA_FILE",
     "ensure_dirs",
     # File reading
     "detect_delimiter",
     "read_tabular_file",
+    "STREAM_MIN_BYTES",
+    "should_stream",
+    "read_tabular_chunks",
     # Dataset loading
     "load_dataset",
+    "write_parquet_mirror",
+    "fresh_parquet_mirror",
+    "remove_parquet_mirror",
+    "read_mirror_if_identical",
     "list_available_files",
     # Dataset context
+    "STATS_SAMPLE_ROWS",
     "get_dataset_context",
     "format_context_for_prompt",
+    "get_formatted_context",
+    "clear_context_cache",
+    "format_sample_preview",
     # Column utilities
     "get_column_names",
     "get_numeric_columns",
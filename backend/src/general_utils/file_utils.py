@@ -5,10 +5,22 @@ Shared functions for reading, loading, and analyzing tabular data files.
 Used by plotting, analytics, and other tools.
 """
 
-import csv
-import pandas as pd
+from __future__ import annotations
+
+import datetime
+import filecmp
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Iterator, Optional
+
+# pandas is imported on first read so lightweight users of this package
+# (paths, listing, prompt formatting) don't pay its import cost
+if TYPE_CHECKING:
+    import pandas as pd
 
 from .logger import get_logger
 
@@ -22,7 +34,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent
 DATABASE_DIR = BASE_DIR / "database"
 FAISS_DIR = DATABASE_DIR / "faiss_store"
 FILES_DIR = DATABASE_DIR / "files"
-METADATA_FILE = DATABASE_DIR / "csv_metadata.json"
+PARQUET_DIR = DATABASE_DIR / "parquet"
+METADATA_DB = DATABASE_DIR / "metadata.sqlite"
+METADATA_FILE = DATABASE_DIR / "csv_metadata.json"  # Legacy JSON store, migrated into METADATA_DB
 
 
 def ensure_dirs():
@@ -30,16 +44,24 @@ def ensure_dirs():
     DATABASE_DIR.mkdir(exist_ok=True)
     FAISS_DIR.mkdir(exist_ok=True)
     FILES_DIR.mkdir(exist_ok=True)
+    PARQUET_DIR.mkdir(exist_ok=True)
 
 
 # =============================================================================
 # File Reading
 # =============================================================================
 
+# Delimiters recognised by detect_delimiter, in tie-break order
+_DELIMITER_CANDIDATES = (b',', b';', b'\t', b'|')
+
+
 def detect_delimiter(file_path: str) -> str:
     """
     Detect the delimiter used in a CSV/TSV file.
     
+    Results are memoized per (path, mtime, size), so the ingest and every
+    later load of an unchanged file sniff it only once.
+    
     Args:
         file_path: Path to the file
         
@@ -47,15 +69,82 @@ def detect_delimiter(file_path: str) -> str:
         Detected delimiter character (defaults to ',' if detection fails)
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            sample = f.read(8192)
-            sniffer = csv.Sniffer()
-            dialect = sniffer.sniff(sample, delimiters=',;\t|')
-            logger.debug(f"Detected delimiter: '{dialect.delimiter}'")
-            return dialect.delimiter
+        stat = os.stat(file_path)
+    except OSError as e:
+        logger.warning(f"Delimiter detection failed: {e}, defaulting to ','")
+        return ','
+    return _detect_delimiter_cached(str(file_path), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=256)
+def _detect_delimiter_cached(file_path: str, mtime_ns: int, size: int) -> str:
+    try:
+        with open(file_path, 'rb') as f:
+            sample = f.read(4096)
     except Exception as e:
         logger.warning(f"Delimiter detection failed: {e}, defaulting to ','")
         return ','
+    
+    # Rank candidates by how often they appear in the header line, then in the
+    # whole sample. Counting is done by C-level bytes.count scans; the header
+    # comes first so decimal commas in ';'-separated data don't win. On a full
+    # tie, earlier candidates (',' first) are preferred.
+    header = sample.split(b'\n', 1)[0]
+    scores = [(header.count(d), sample.count(d)) for d in _DELIMITER_CANDIDATES]
+    best = max(range(len(scores)), key=lambda i: scores[i])
+    
+    if scores[best] == (0, 0):
+        logger.debug("No delimiter found in sample, defaulting to ','")
+        return ','
+    
+    delimiter = _DELIMITER_CANDIDATES[best].decode()
+    logger.debug(f"Detected delimiter: '{delimiter}'")
+    return delimiter
+
+
+def _is_parsed_temporal(column: pd.Series) -> bool:
+    """Whether the PyArrow engine parsed a column as dates, times or timestamps."""
+    import pandas as pd
+    
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return True
+    if column.dtype != object:
+        return False
+    # date32/time64 columns come back as object columns of date/time values
+    first = column.dropna()[:1]
+    return len(first) == 1 and isinstance(first.iloc[0], (datetime.date, datetime.time))
+
+
+def _read_delimited(file_path: str, delimiter: str) -> pd.DataFrame:
+    """
+    Read a delimited text file with pandas' multi-threaded PyArrow engine.
+    
+    Date and time columns are kept as text, as the C engine reads them, so
+    the dtypes match those of large files ingested by read_tabular_chunks.
+    
+    Falls back to the default C engine for input the PyArrow parser rejects
+    (e.g. ragged rows) or when pyarrow is not installed. The fallback infers
+    each column's type from the whole file in one pass (low_memory=False),
+    like the PyArrow engine, instead of per internal chunk, which can leave
+    mixed-type object columns.
+    """
+    import pandas as pd
+    
+    # ArrowInvalid and pandas' ParserError are both ValueErrors; anything
+    # else (e.g. MemoryError) would only recur in the slower fallback
+    try:
+        df = pd.read_csv(file_path, delimiter=delimiter, engine='pyarrow')
+        temporal = [c for c in df.columns if _is_parsed_temporal(df[c])]
+        if temporal:
+            # Re-read just those columns as strings
+            df[temporal] = pd.read_csv(
+                file_path, delimiter=delimiter, engine='pyarrow',
+                usecols=temporal, dtype=dict.fromkeys(temporal, str),
+            )
+        return df
+    except (ValueError, ImportError) as e:
+        logger.debug(f"PyArrow CSV engine failed ({e}), retrying with default engine")
+        return pd.read_csv(file_path, delimiter=delimiter, low_memory=False)
 
 
 def read_tabular_file(file_path: str) -> tuple[pd.DataFrame, dict]:
@@ -88,6 +177,8 @@ def read_tabular_file(file_path: str) -> tuple[pd.DataFrame, dict]:
     
     # Excel files
     if extension in ['.xlsx', '.xls']:
+        import pandas as pd
+        
         try:
             df = pd.read_excel(file_path, engine='openpyxl' if extension == '.xlsx' else 'xlrd')
             file_info["type"] = "excel"
@@ -99,7 +190,7 @@ def read_tabular_file(file_path: str) -> tuple[pd.DataFrame, dict]:
     
     # TSV files (explicit .tsv extension)
     if extension == '.tsv':
-        df = pd.read_csv(file_path, delimiter='\t')
+        df = _read_delimited(file_path, '\t')
         file_info["type"] = "tsv"
         file_info["delimiter"] = '\t'
         logger.info(f"Read TSV file: {df.shape[0]} rows, {df.shape[1]} columns")
@@ -108,7 +199,7 @@ def read_tabular_file(file_path: str) -> tuple[pd.DataFrame, dict]:
     # CSV and other text-based files - auto-detect delimiter
     if extension in ['.csv', '.txt', '']:
         delimiter = detect_delimiter(file_path)
-        df = pd.read_csv(file_path, delimiter=delimiter)
+        df = _read_delimited(file_path, delimiter)
         
         if delimiter == '\t':
             file_info["type"] = "tsv"
@@ -122,7 +213,7 @@ def read_tabular_file(file_path: str) -> tuple[pd.DataFrame, dict]:
     # Unsupported extension - try as CSV anyway
     try:
         delimiter = detect_delimiter(file_path)
-        df = pd.read_csv(file_path, delimiter=delimiter)
+        df = _read_delimited(file_path, delimiter)
         file_info["type"] = "csv"
         file_info["delimiter"] = delimiter
         logger.info(f"Read file as CSV: {df.shape[0]} rows, {df.shape[1]} columns")
@@ -132,14 +223,183 @@ def read_tabular_file(file_path: str) -> tuple[pd.DataFrame, dict]:
         raise ValueError(f"Unsupported file type '{extension}': {str(e)}")
 
 
+# Delimited files at least this large are read in chunks during ingestion
+STREAM_MIN_BYTES = 256 * 1024 * 1024
+
+
+def should_stream(file_path: str) -> bool:
+    """True if a file is delimited text and large enough to read in chunks."""
+    if Path(file_path).suffix.lower() in ('.xlsx', '.xls'):
+        return False
+    try:
+        return os.path.getsize(file_path) >= STREAM_MIN_BYTES
+    except OSError:
+        return False
+
+
+def read_tabular_chunks(file_path: str, chunksize: int) -> tuple[Iterator[pd.DataFrame], dict]:
+    """
+    Read a delimited file (CSV, TSV) as an iterator of DataFrame chunks.
+    
+    Only one chunk of chunksize rows is in memory at a time. Chunks keep a
+    running RangeIndex, so row labels match a full read. Uses the C engine
+    (the PyArrow engine can't read in chunks), and per-chunk type inference
+    may differ between chunks (e.g. int vs float when a later chunk has NaNs).
+    
+    Args:
+        file_path: Path to the delimited file
+        chunksize: Rows per chunk
+    
+    Returns:
+        Tuple of (chunk iterator, file_info dict with 'type' and 'delimiter')
+    """
+    import pandas as pd
+    
+    extension = Path(file_path).suffix.lower()
+    delimiter = '\t' if extension == '.tsv' else detect_delimiter(file_path)
+    file_info = {
+        "type": "tsv" if delimiter == '\t' else "csv",
+        "delimiter": delimiter,
+        "extension": extension,
+    }
+    logger.info(f"Streaming tabular file: {file_path} ({chunksize} rows per chunk, delimiter='{delimiter}')")
+    return pd.read_csv(file_path, delimiter=delimiter, chunksize=chunksize), file_info
+
+
 # =============================================================================
 # Dataset Loading & Listing
 # =============================================================================
 
+def _parquet_mirror_path(filename: str) -> Path:
+    """Path of the Parquet mirror for a stored file (kept outside FILES_DIR)."""
+    return PARQUET_DIR / f"{filename}.parquet"
+
+
+def write_parquet_mirror(df: pd.DataFrame, filename: str) -> bool:
+    """
+    Write a zstd-compressed Parquet copy of a parsed dataset.
+    
+    load_dataset() reads the mirror instead of re-parsing the original file.
+    Failures (e.g. pyarrow missing, mixed-type object columns) are logged and
+    leave no mirror behind, so loading falls back to the original file.
+    
+    Args:
+        df: Parsed DataFrame of the stored file
+        filename: Name of the file in FILES_DIR
+        
+    Returns:
+        True if the mirror was written
+    """
+    mirror_path = _parquet_mirror_path(filename)
+    tmp_path = mirror_path.with_name(mirror_path.name + ".tmp")
+    try:
+        PARQUET_DIR.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(tmp_path, engine='pyarrow', compression='zstd', index=False)
+        # Atomic swap so concurrent loaders never see a partial file
+        os.replace(tmp_path, mirror_path)
+        logger.debug(f"Wrote Parquet mirror: {mirror_path}")
+        return True
+    except Exception as e:
+        logger.warning(f"Could not write Parquet mirror for {filename}: {e}")
+        tmp_path.unlink(missing_ok=True)
+        return False
+
+
+def _read_parquet_mirror(filename: str, file_path: Path) -> Optional[pd.DataFrame]:
+    """Read the Parquet mirror if it exists and is not older than the original."""
+    mirror_path = _parquet_mirror_path(filename)
+    try:
+        if os.stat(mirror_path).st_mtime_ns < os.stat(file_path).st_mtime_ns:
+            return None
+    except FileNotFoundError:
+        return None
+    
+    import pandas as pd
+    
+    try:
+        return pd.read_parquet(mirror_path, engine='pyarrow')
+    except Exception as e:
+        logger.warning(f"Failed to read Parquet mirror for {filename}: {e}")
+        return None
+
+
+def fresh_parquet_mirror(filename: str) -> Optional[Path]:
+    """Path of a stored file's Parquet mirror if it exists and is not older than the file, else None."""
+    mirror_path = _parquet_mirror_path(filename)
+    try:
+        if os.stat(mirror_path).st_mtime_ns >= os.stat(FILES_DIR / filename).st_mtime_ns:
+            return mirror_path
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def remove_parquet_mirror(filename: str):
+    """Delete a stored file's Parquet mirror, if any (e.g. when the file is replaced)."""
+    _parquet_mirror_path(filename).unlink(missing_ok=True)
+
+
+def read_mirror_if_identical(file_path: str, filename: str) -> Optional[pd.DataFrame]:
+    """
+    Return the stored file's Parquet mirror if file_path has the same bytes.
+    
+    Lets a re-ingest of an unchanged file skip delimiter detection, parsing
+    and type inference. Comparing bytes reads both files once, which is far
+    cheaper than parsing either.
+    
+    Args:
+        file_path: Incoming file
+        filename: Name of the stored file in FILES_DIR
+        
+    Returns:
+        DataFrame, or None if the contents differ or there is no valid mirror
+    """
+    stored_path = FILES_DIR / filename
+    try:
+        identical = os.path.samefile(file_path, stored_path) or (
+            os.path.getsize(file_path) == os.path.getsize(stored_path)
+            and filecmp.cmp(file_path, stored_path, shallow=False)
+        )
+    except OSError:
+        return None
+    if not identical:
+        return None
+    return _read_parquet_mirror(filename, stored_path)
+
+
+# Recently loaded DataFrames keyed by the stored file's identity, so tool
+# calls in the same conversation skip the Parquet read
+DATASET_CACHE_BYTES = 1 << 30
+_dataset_cache: OrderedDict[tuple, tuple[int, pd.DataFrame]] = OrderedDict()  # key -> (bytes, df)
+_dataset_cache_bytes = 0
+_dataset_cache_lock = threading.Lock()
+
+
+def _cache_dataset(key: tuple, df: pd.DataFrame):
+    global _dataset_cache_bytes
+    size = int(df.memory_usage(index=True, deep=True).sum())
+    if size > DATASET_CACHE_BYTES:
+        return
+    with _dataset_cache_lock:
+        # Drop older versions of the same file before storing this one
+        for stale in [k for k in _dataset_cache if k[0] == key[0]]:
+            _dataset_cache_bytes -= _dataset_cache.pop(stale)[0]
+        _dataset_cache[key] = (size, df)
+        _dataset_cache_bytes += size
+        while _dataset_cache_bytes > DATASET_CACHE_BYTES:
+            _, (evicted_size, _) = _dataset_cache.popitem(last=False)
+            _dataset_cache_bytes -= evicted_size
+
+
 def load_dataset(filename: str) -> Optional[pd.DataFrame]:
     """
     Load a dataset from the stored files directory.
     
+    Recently loaded files are served from an in-memory cache (as a copy,
+    since callers may modify the frame). Otherwise prefers the file's
+    Parquet mirror; the original is parsed (and the mirror written for next
+    time) only when the mirror is missing or stale.
+    
     Args:
         filename: Name of the file to load
         
@@ -149,37 +409,138 @@ def load_dataset(filename: str) -> Optional[pd.DataFrame]:
     logger.debug(f"Loading dataset: {filename}")
     file_path = FILES_DIR / filename
     
-    if not file_path.exists():
+    try:
+        stat = os.stat(file_path)
+    except OSError:
         logger.warning(f"File not found: {file_path}")
         return None
     
-    try:
-        df, _ = read_tabular_file(str(file_path))
-        logger.debug(f"Dataset loaded: {df.shape[0]} rows, {df.shape[1]} columns")
-        return df
-    except Exception as e:
-        logger.error(f"Failed to load dataset: {e}")
-        return None
+    key = (filename, stat.st_mtime_ns, stat.st_size)
+    with _dataset_cache_lock:
+        entry = _dataset_cache.get(key)
+        if entry is not None:
+            _dataset_cache.move_to_end(key)
+    if entry is not None:
+        df = entry[1]
+        logger.debug(f"Dataset served from memory: {df.shape[0]} rows, {df.shape[1]} columns")
+        return df.copy()
+    
+    df = _read_parquet_mirror(filename, file_path)
+    if df is not None:
+        logger.debug(f"Dataset loaded from Parquet mirror: {df.shape[0]} rows, {df.shape[1]} columns")
+    else:
+        try:
+            df, _ = read_tabular_file(str(file_path))
+            logger.debug(f"Dataset loaded: {df.shape[0]} rows, {df.shape[1]} columns")
+        except Exception as e:
+            logger.error(f"Failed to load dataset: {e}")
+            return None
+        write_parquet_mirror(df, filename)
+    
+    _cache_dataset(key, df)
+    return df.copy()
+
+
+# Directory listing cached on FILES_DIR's mtime (changes on add/remove/rename)
+_files_listing_cache: tuple[int, list[str]] | None = None
 
 
 def list_available_files() -> list[str]:
     """
     List all available dataset files.
     
+    The listing is cached until the files directory's mtime changes.
+    
     Returns:
         List of filenames
     """
-    if not FILES_DIR.exists():
+    global _files_listing_cache
+    try:
+        dir_mtime = os.stat(FILES_DIR).st_mtime_ns
+    except FileNotFoundError:
         return []
-    files = [f.name for f in FILES_DIR.iterdir() if f.is_file()]
+    
+    cached = _files_listing_cache
+    if cached is not None and cached[0] == dir_mtime:
+        return list(cached[1])
+    
+    # DirEntry.is_file() uses the d_type from readdir, avoiding a stat per entry
+    with os.scandir(FILES_DIR) as entries:
+        files = [e.name for e in entries if e.is_file()]
+    
+    _files_listing_cache = (dir_mtime, files)
     logger.debug(f"Available files: {files}")
-    return files
+    return list(files)
 
 
 # =============================================================================
 # Dataset Context (for LLM prompts)
 # =============================================================================
 
+# Rows scanned for per-column statistics; larger frames report approximate counts
+STATS_SAMPLE_ROWS = 100_000
+
+
+# Numeric column and row counts from which unique values are counted on a
+# thread pool; below them thread hand-off costs more than the counting
+PARALLEL_NUNIQUE_MIN_COLUMNS = 16
+PARALLEL_NUNIQUE_MIN_ROWS = 100_000
+
+_nunique_pool: Optional[ThreadPoolExecutor] = None
+_nunique_pool_lock = threading.Lock()
+
+
+def _get_nunique_pool() -> ThreadPoolExecutor:
+    """Shared pool for _count_uniques, started on first use."""
+    global _nunique_pool
+    with _nunique_pool_lock:
+        if _nunique_pool is None:
+            _nunique_pool = ThreadPoolExecutor(
+                max_workers=os.cpu_count() or 1, thread_name_prefix="nunique"
+            )
+        return _nunique_pool
+
+# Unique values are first counted over UNIQUE_PROBE_ROWS rows; only columns
+# that look categorical there (fewer than UNIQUE_EXACT_MAX values) are counted
+# over the full STATS_SAMPLE_ROWS, the rest are reported as lower bounds
+UNIQUE_PROBE_ROWS = 1000
+UNIQUE_EXACT_MAX = 100
+
+
+def _count_uniques(df: pd.DataFrame) -> list[int]:
+    """
+    Count non-null unique values per column (same result as df.nunique()).
+    
+    On wide, long frames, plain numeric columns are counted with np.unique
+    across a shared thread pool (its sort releases the GIL); other columns
+    use nunique().
+    """
+    import numpy as np
+    
+    numeric = [
+        i for i, d in enumerate(df.dtypes)
+        if isinstance(d, np.dtype) and d.kind in "iuf"
+    ]
+    if len(numeric) < PARALLEL_NUNIQUE_MIN_COLUMNS or len(df) < PARALLEL_NUNIQUE_MIN_ROWS:
+        return df.nunique().tolist()
+    
+    def count(i: int) -> int:
+        values = df.iloc[:, i].to_numpy()
+        if values.dtype.kind == "f":
+            values = values[~np.isnan(values)]
+        return len(np.unique(values))
+    
+    counts: list[Optional[int]] = [None] * df.shape[1]
+    for i, n in zip(numeric, _get_nunique_pool().map(count, numeric)):
+        counts[i] = n
+    
+    rest = [i for i, n in enumerate(counts) if n is None]
+    if rest:
+        for i, n in zip(rest, df.iloc[:, rest].nunique().tolist()):
+            counts[i] = n
+    return counts
+
+
 def get_dataset_context(df: pd.DataFrame, filename: str = "dataset", file_metadata: dict | None = None) -> dict:
     """
     Get dataset context for LLM prompts (columns info, sample data, shape, file info).
@@ -200,27 +561,49 @@ def get_dataset_context(df: pd.DataFrame, filename: str = "dataset", file_metada
         - shape: {"rows": int, "columns": int}
         - columns: List of column info dicts
         - head_5: First 5 rows as list of dicts
+        - head_5_rows: Same rows as lists of cell strings (max 20 chars), or None
     """
     logger.debug(f"Getting dataset context for {filename}")
     
-    # Get column info
+    # Get column info: dtypes in one frame-level call, unique counts from a
+    # short probe (see UNIQUE_PROBE_ROWS), samples from the first rows (full
+    # column only if those are mostly null). Long frames are scanned up to
+    # STATS_SAMPLE_ROWS, making counts lower bounds.
+    stats_df = df.head(STATS_SAMPLE_ROWS) if len(df) > STATS_SAMPLE_ROWS else df
+    dtypes = df.dtypes.astype(str).tolist()
+    unique_counts = _count_uniques(df.head(UNIQUE_PROBE_ROWS))
+    approx = [len(df) > UNIQUE_PROBE_ROWS] * df.shape[1]
+    if len(df) > UNIQUE_PROBE_ROWS:
+        low = [i for i, n in enumerate(unique_counts) if n < UNIQUE_EXACT_MAX]
+        if low:
+            for i, n in zip(low, _count_uniques(stats_df.iloc[:, low])):
+                unique_counts[i] = n
+                approx[i] = len(df) > STATS_SAMPLE_ROWS
+    head_3 = df.head(3)
     columns_info = []
-    for col in df.columns:
-        dtype = str(df[col].dtype)
-        unique_count = df[col].nunique()
-        sample_values = df[col].dropna().head(3).tolist()
+    for i, (col, dtype, unique_count) in enumerate(zip(df.columns, dtypes, unique_counts)):
+        sample_values = head_3.iloc[:, i].dropna().tolist()
+        if len(sample_values) < len(head_3):
+            sample_values = stats_df.iloc[:, i].dropna().head(3).tolist()
         columns_info.append({
             "name": col,
             "dtype": dtype,
             "unique_count": unique_count,
+            "unique_count_approx": approx[i],
             "samples": sample_values
         })
     
-    # Get head(5)
+    # Get head(5), plus the same rows pre-formatted as 20-char cell strings
+    # aligned to the column order (used by format_context_for_prompt)
+    head_df = df.head(5)
     try:
-        head_5 = df.head(5).to_dict(orient='records')
+        head_5 = head_df.to_dict(orient='records')
     except Exception:
         head_5 = []
+    try:
+        head_5_rows = head_df.astype(str).apply(lambda s: s.str.slice(0, 20)).values.tolist()
+    except Exception:
+        head_5_rows = None
     
     logger.debug(f"Context: {df.shape[0]} rows, {df.shape[1]} columns")
     
@@ -230,7 +613,8 @@ def get_dataset_context(df: pd.DataFrame, filename: str = "dataset", file_metada
         "delimiter": file_metadata.get("delimiter") if file_metadata else None,
         "shape": {"rows": df.shape[0], "columns": df.shape[1]},
         "columns": columns_info,
-        "head_5": head_5
+        "head_5": head_5,
+        "head_5_rows": head_5_rows,
     }
     
     return context
@@ -264,19 +648,21 @@ def format_context_for_prompt(context: dict) -> str:
     
     # Format columns info
     columns_str = "\n".join([
-        f"  - {c['name']} ({c['dtype']}): {c['unique_count']} unique, samples: {c['samples']}"
+        f"  - {c['name']} ({c['dtype']}): {'≥' if c.get('unique_count_approx') else ''}{c['unique_count']} unique, samples: {c['samples']}"
         for c in context["columns"]
     ])
     
-    # Format head_5 as a table
+    # Format head_5 as a table (from the pre-formatted rows when available)
     head_5 = context.get("head_5", [])
     if head_5:
-        headers = list(head_5[0].keys()) if head_5 else []
-        head_str = "Sample data (first 5 rows):\n"
-        head_str += " | ".join(headers) + "\n"
-        head_str += "-" * 50 + "\n"
-        for row in head_5:
-            head_str += " | ".join([str(row.get(h, ""))[:20] for h in headers]) + "\n"
+        headers = list(head_5[0].keys())
+        rows = context.get("head_5_rows")
+        if rows is None or len(rows[0]) != len(headers):
+            rows = [[str(row.get(h, ""))[:20] for h in headers] for row in head_5]
+        # Collect the lines and join once rather than growing a string
+        lines = ["Sample data (first 5 rows):", " | ".join(map(str, headers)), "-" * 50]
+        lines.extend(" | ".join(row) for row in rows)
+        head_str = "\n".join(lines) + "\n"
     else:
         head_str = "No sample data available"
     
@@ -290,22 +676,99 @@ def format_context_for_prompt(context: dict) -> str:
 {head_str}"""
 
 
+# Formatted dataset contexts keyed by the stored file's identity and format
+CONTEXT_CACHE_SIZE = 32
+_context_cache: OrderedDict[tuple, str] = OrderedDict()
+_context_cache_lock = threading.Lock()
+
+
+def get_formatted_context(df: pd.DataFrame, filename: str, file_metadata: dict | None = None) -> str:
+    """
+    Get format_context_for_prompt(get_dataset_context(...)) for a stored file, memoized.
+    
+    The result is cached on (filename, mtime, size, file_type, delimiter) of
+    the file in FILES_DIR, so repeated tool calls on an unchanged file skip
+    the per-column scan. Files not in FILES_DIR are formatted uncached.
+    
+    Args:
+        df: The file's DataFrame (only read on a cache miss)
+        filename: Name of the file in FILES_DIR
+        file_metadata: Optional metadata dict from get_file_metadata()
+        
+    Returns:
+        Formatted context string ready to insert into prompts
+    """
+    try:
+        stat = os.stat(FILES_DIR / filename)
+    except OSError:
+        return format_context_for_prompt(get_dataset_context(df, filename, file_metadata))
+    
+    key = (
+        filename,
+        stat.st_mtime_ns,
+        stat.st_size,
+        file_metadata.get("file_type") if file_metadata else None,
+        file_metadata.get("delimiter") if file_metadata else None,
+    )
+    with _context_cache_lock:
+        cached = _context_cache.get(key)
+        if cached is not None:
+            _context_cache.move_to_end(key)
+            logger.debug(f"Using cached dataset context for {filename}")
+            return cached
+    
+    context_str = format_context_for_prompt(get_dataset_context(df, filename, file_metadata))
+    with _context_cache_lock:
+        _context_cache[key] = context_str
+        while len(_context_cache) > CONTEXT_CACHE_SIZE:
+            _context_cache.popitem(last=False)
+    return context_str
+
+
+def clear_context_cache():
+    """Drop all memoized dataset contexts (call when stored files are removed)."""
+    with _context_cache_lock:
+        _context_cache.clear()
+
+
+def format_sample_preview(rows: list[dict], max_rows: int = 3, max_cols: int = 5, width: int = 15) -> str:
+    """
+    Format sample rows as a compact, fixed-width preview for the agent's system prompt.
+    
+    Args:
+        rows: Sample rows as dicts (e.g. the stored head_5)
+        max_rows: Number of rows to include
+        max_cols: Number of leading columns to include
+        width: Maximum characters per cell
+        
+    Returns:
+        One indented line per row with cells joined by ' | ' (empty if no rows)
+    """
+    if not rows:
+        return ""
+    columns = list(rows[0].keys())[:max_cols]
+    return "\n".join(
+        "      " + " | ".join(str(row.get(c, ""))[:width] for c in columns)
+        for row in rows[:max_rows]
+    )
+
+
 def get_column_names(df: pd.DataFrame) -> list[str]:
     """Get list of column names from DataFrame."""
     return list(df.columns)
 
 
 def get_numeric_columns(df: pd.DataFrame) -> list[str]:
-    """Get list of numeric column names."""
-    return df.select_dtypes(include=['number']).columns.tolist()
+    """Get list of numeric column names (int, uint, float, complex; not bool)."""
+    return [c for c, d in zip(df.columns, df.dtypes) if d.kind in "iufc"]
 
 
 def get_categorical_columns(df: pd.DataFrame) -> list[str]:
     """Get list of categorical/object column names."""
-    return df.select_dtypes(include=['object', 'category']).columns.tolist()
+    return [c for c, d in zip(df.columns, df.dtypes) if d.name in ("object", "category")]
 
 
 def get_datetime_columns(df: pd.DataFrame) -> list[str]:
-    """Get list of datetime column names."""
-    return df.select_dtypes(include=['datetime64']).columns.tolist()
-
+    """Get list of datetime column names (timezone-naive and timezone-aware)."""
+    # Both datetime64[ns] and DatetimeTZDtype report kind "M"
+    return [c for c, d in zip(df.columns, df.dtypes) if d.kind == "M"]
@@ -1,5 +1,8 @@
+import atexit
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 
 # Create logs directory
@@ -7,6 +10,23 @@ PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
 LOGS_DIR = PROJECT_ROOT / "logs"
 LOGS_DIR.mkdir(exist_ok=True)
 
+# File handler - DEBUG and above. One handler shared by all loggers, fed by a
+# background listener thread so callers only enqueue records and never block
+# on file I/O.
+_file_handler = logging.FileHandler(LOGS_DIR / "cellbyte.log", encoding='utf-8')
+_file_handler.setLevel(logging.DEBUG)
+_file_handler.setFormatter(logging.Formatter(
+    '%(asctime)s | %(name)-20s | %(levelname)-8s | %(funcName)s:%(lineno)d | %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+))
+
+_log_queue: queue.Queue = queue.Queue(-1)
+_log_listener = QueueListener(_log_queue, _file_handler, respect_handler_level=True)
+_log_listener.start()
+# Flush queued records on interpreter exit
+atexit.register(_log_listener.stop)
+
+
 def get_logger(name: str) -> logging.Logger:
     """Get a configured logger instance."""
     logger = logging.getLogger(name)
@@ -23,17 +43,11 @@ def get_logger(name: str) -> logging.Logger:
         )
         console_handler.setFormatter(console_format)
         
-        # File handler - DEBUG and above
-        file_handler = logging.FileHandler(LOGS_DIR / "cellbyte.log", encoding='utf-8')
-        file_handler.setLevel(logging.DEBUG)
-        file_format = logging.Formatter(
-            '%(asctime)s | %(name)-20s | %(levelname)-8s | %(funcName)s:%(lineno)d | %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        file_handler.setFormatter(file_format)
+        # Queue handler - DEBUG and above, written to the log file by the listener
+        queue_handler = QueueHandler(_log_queue)
+        queue_handler.setLevel(logging.DEBUG)
         
         logger.addHandler(console_handler)
-        logger.addHandler(file_handler)
+        logger.addHandler(queue_handler)
     
     return logger
-
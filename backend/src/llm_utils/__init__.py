@@ -4,28 +4,42 @@ LLM Utilities
 LangChain/LangGraph specific functions for:
 - CSV ingestion with vectorstore
 - Agent tools (search, plot)
+
+Exports are resolved on first access, so importing a light submodule
+(e.g. llm_utils.query_cache) doesn't load FAISS, pandas and the tools.
 """
 
-from .csv_ingestion import (
-    ingest_file,
-    ingest_csv,  # backward-compatible alias
-    get_csv_metadata,
-    get_file_metadata,
-    get_vectorstore,
-    delete_file,
-)
-from .tools import search_data, create_plot, ALL_TOOLS
-
-__all__ = [
+import importlib
+
+# Exported name -> submodule that defines it
+_EXPORTS = {
     # Ingestion
-    "ingest_file",
-    "ingest_csv", 
-    "get_csv_metadata",
-    "get_file_metadata",
-    "get_vectorstore",
-    "delete_file",
+    "ingest_file": ".csv_ingestion",
+    "ingest_csv": ".csv_ingestion",  # backward-compatible alias
+    "get_csv_metadata": ".csv_ingestion",
+    "get_file_metadata": ".csv_ingestion",
+    "get_vectorstore": ".csv_ingestion",
+    "reset_vectorstore_cache": ".csv_ingestion",
+    "delete_file": ".csv_ingestion",
     # Tools
-    "search_data",
-    "create_plot",
-    "ALL_TOOLS",
-]
+    "search_data": ".tools",
+    "search_data_batch": ".tools",
+    "analyze_data": ".tools",
+    "create_plot": ".tools",
+    "ALL_TOOLS": ".tools",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -5,46 +5,65 @@ LLM-powered data analytics using Python/SciPy.
 Includes retry logic via conversation history.
 """
 
+import re
+from functools import lru_cache
+
 import pandas as pd
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage
 
 from general_utils import (
     get_logger,
     load_dataset,
     list_available_files,
-    get_dataset_context,
-    format_context_for_prompt,
+    get_formatted_context,
     get_numeric_columns,
 )
 from .csv_ingestion import get_file_metadata
+from .clients import get_chat_model
 
 logger = get_logger("analytics")
 
 MAX_RETRIES = 3
 
 
+# Static parts of the code-generation prompt; run_analytics joins them with
+# the dataset context and the user's request in one pass
+_ANALYTICS_PROMPT_HEAD = """You are a Python data analytics expert. Generate analysis code.
+
+"""
+
+_ANALYTICS_PROMPT_REQUIREMENTS = """
+
+REQUIREMENTS:
+1. Use pandas, numpy, scipy.stats as needed
+2. DataFrame is loaded as `df`
+3. Store result in variable `result` as dict with:
+   - "summary": human-readable findings string
+   - "data": numerical/tabular results
+4. Handle NaN values appropriately
+5. Round numbers to 4 decimal places
+6. Only use columns that exist in the dataset above
+7. Return ONLY Python code, no markdown or explanations"""
+
+
+# Optional opening ```/```python fence, the code, optional closing fence
+_CODE_FENCE = re.compile(r"^\s*(?:```(?:python|py)?[ \t]*\n?)?(.*?)\s*(?:```)?\s*$", re.DOTALL)
+
+
 def _clean_code(code: str) -> str:
     """Remove markdown formatting from code."""
-    if code.startswith("```python"):
-        code = code[9:]
-    if code.startswith("```"):
-        code = code[3:]
-    if code.endswith("```"):
-        code = code[:-3]
-    return code.strip()
+    return _CODE_FENCE.match(code).group(1).strip()
 
 
-def _execute_analytics_code(code: str, df: pd.DataFrame) -> dict:
-    """Execute analytics code and return result dict."""
-    import re
+@lru_cache(maxsize=1)
+def _analytics_globals() -> dict:
+    """Modules exposed to analytics code, imported once on first use."""
     import numpy as np
     from scipy import stats
     import sklearn
     from sklearn import preprocessing, metrics, cluster
     
-    exec_globals = {
-        "df": df,
+    return {
         "pd": pd,
         "np": np,
         "re": re,           # Regular expressions
@@ -54,9 +73,23 @@ def _execute_analytics_code(code: str, df: pd.DataFrame) -> dict:
         "metrics": metrics,
         "cluster": cluster,
     }
+
+
+@lru_cache(maxsize=64)
+def _compile_analytics_code(code: str):
+    """Compile analytics code, reusing the code object when the same code repeats."""
+    return compile(code, "<analytics>", "exec")
+
+
+def _execute_analytics_code(code: str, df: pd.DataFrame) -> dict:
+    """Execute analytics code and return result dict."""
+    compiled = _compile_analytics_code(code)
+    
+    # Fresh globals per run so results and names never leak between runs
+    exec_globals = {**_analytics_globals(), "df": df}
     exec_locals = {}
     
-    exec(code, exec_globals, exec_locals)
+    exec(compiled, exec_globals, exec_locals)
     
     result = exec_locals.get("result") or exec_globals.get("result")
     if result is None:
@@ -92,28 +125,17 @@ def run_analytics(analytics_request: str, filename: str) -> dict:
     # Get file metadata (includes delimiter, file_type)
     file_metadata = get_file_metadata(filename)
     
-    # Build context and initial prompt
-    context_str = format_context_for_prompt(get_dataset_context(df, filename, file_metadata))
+    # Build context (memoized per file version) and initial prompt
+    context_str = get_formatted_context(df, filename, file_metadata)
     
-    system_prompt = f"""You are a Python data analytics expert. Generate analysis code.
-
-{context_str}
-
-REQUIREMENTS:
-1. Use pandas, numpy, scipy.stats as needed
-2. DataFrame is loaded as `df`
-3. Store result in variable `result` as dict with:
-   - "summary": human-readable findings string
-   - "data": numerical/tabular results
-4. Handle NaN values appropriately
-5. Round numbers to 4 decimal places
-6. Only use columns that exist in the dataset above
-7. Return ONLY Python code, no markdown or explanations"""
-
     # Initialize conversation
-    messages = [HumanMessage(content=f"{system_prompt}\n\nUSER REQUEST: {analytics_request}")]
+    prompt = "".join((
+        _ANALYTICS_PROMPT_HEAD, context_str, _ANALYTICS_PROMPT_REQUIREMENTS,
+        "\n\nUSER REQUEST: ", analytics_request,
+    ))
+    messages = [HumanMessage(content=prompt)]
     
-    llm = ChatOpenAI(model="gpt-5.1", temperature=0)
+    llm = get_chat_model()
     code = None
     
     for attempt in range(MAX_RETRIES):
@@ -165,7 +187,12 @@ def quick_describe(filename: str) -> dict:
 
 
 def quick_correlation(filename: str, method: str = "pearson") -> dict:
-    """Get correlation matrix for numeric columns."""
+    """
+    Get correlation matrix for numeric columns.
+    
+    The matrix is returned as {"columns": [...], "values": [[...], ...]} (rows
+    and columns in the same order) rather than a nested dict per cell.
+    """
     df = load_dataset(filename)
     if df is None:
         raise FileNotFoundError(f"File '{filename}' not found")
@@ -177,7 +204,7 @@ def quick_correlation(filename: str, method: str = "pearson") -> dict:
     corr = df[numeric_cols].corr(method=method)
     return {
         "summary": f"{method.capitalize()} correlation matrix for {len(numeric_cols)} numeric columns",
-        "data": corr.to_dict()
+        "data": {"columns": corr.columns.tolist(), "values": corr.to_numpy().tolist()},
     }
 
 
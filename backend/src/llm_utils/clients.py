@@ -0,0 +1,217 @@
+"""
+LLM Clients
+
+Process-wide OpenAI client instances shared by the agent and tools, so the
+underlying HTTP connection pool stays warm between requests.
+"""
+
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Optional, TypeVar
+
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from openai import RateLimitError
+
+from general_utils import get_logger
+
+logger = get_logger("clients")
+
+T = TypeVar("T")
+
+CHAT_MODEL = "gpt-5.1"
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+# One keep-alive HTTP/2 pool per process for every OpenAI request, so chat
+# and embedding calls reuse TLS sessions instead of each client opening its own
+_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+_HTTP_TIMEOUT = 60
+
+_http_client = httpx.Client(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT, http2=True)
+_http_async_client = httpx.AsyncClient(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT, http2=True)
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(model: str = CHAT_MODEL) -> ChatOpenAI:
+    """
+    Get the shared ChatOpenAI client for a model.
+    
+    Args:
+        model: OpenAI chat model name
+    
+    Returns:
+        ChatOpenAI instance (temperature=0), created on first use
+    """
+    return ChatOpenAI(
+        model=model,
+        temperature=0,
+        http_client=_http_client,
+        http_async_client=_http_async_client,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_embeddings(model: str = EMBEDDING_MODEL) -> OpenAIEmbeddings:
+    """
+    Get the shared OpenAIEmbeddings client for a model.
+    
+    Args:
+        model: OpenAI embedding model name
+    
+    Returns:
+        OpenAIEmbeddings instance, created on first use
+    """
+    return OpenAIEmbeddings(
+        model=model,
+        chunk_size=1000,  # Texts per embeddings request
+        max_retries=2,  # Sustained 429s are left to the RateController
+        http_client=_http_client,
+        http_async_client=_http_async_client,
+    )
+
+
+# =============================================================================
+# Rate Limiting
+# =============================================================================
+
+# Attempts per call after a 429 before the error is raised to the caller
+RATE_LIMIT_MAX_ATTEMPTS = 6
+# Successful calls before the concurrency limit is raised by one again
+RATE_LIMIT_RECOVER_AFTER = 20
+
+
+class RateController:
+    """
+    Adaptive concurrency limit and tokens-per-minute bucket for OpenAI calls.
+    
+    Every call waits for a free slot and, when a TPM budget is configured,
+    for enough tokens in the bucket. A RateLimitError halves the number of
+    slots, pauses all callers for the server's Retry-After and retries; after
+    RATE_LIMIT_RECOVER_AFTER consecutive successes one slot is given back, up
+    to max_parallelism.
+    
+    Attributes:
+        max_parallelism: Upper bound on calls in flight
+        tokens_per_minute: Token budget per minute, or None for no bucket
+    """
+    
+    def __init__(self, max_parallelism: int = 4, tokens_per_minute: Optional[int] = None):
+        self.max_parallelism = max_parallelism
+        self.tokens_per_minute = tokens_per_minute
+        self._parallelism = max_parallelism
+        self._in_flight = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._tokens = float(tokens_per_minute or 0)
+        self._refilled_at = time.monotonic()
+        self._cond = threading.Condition()
+    
+    @property
+    def parallelism(self) -> int:
+        return self._parallelism
+    
+    def call(self, fn: Callable[..., T], *args, tokens: int = 0, **kwargs) -> T:
+        """
+        Run fn(*args, **kwargs) within the rate limits, retrying on 429s.
+        
+        Args:
+            fn: OpenAI-backed callable (e.g. embed_documents, invoke)
+            tokens: Estimated tokens the call consumes, charged to the bucket
+            
+        Returns:
+            fn's return value
+        """
+        for attempt in range(1, RATE_LIMIT_MAX_ATTEMPTS + 1):
+            self._acquire(tokens)
+            try:
+                result = fn(*args, **kwargs)
+            except RateLimitError as e:
+                self._release(succeeded=False)
+                if attempt == RATE_LIMIT_MAX_ATTEMPTS:
+                    raise
+                self._back_off(e, attempt)
+                continue
+            except BaseException:
+                self._release(succeeded=False)
+                raise
+            self._release(succeeded=True)
+            return result
+    
+    def _acquire(self, tokens: int):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                if wait <= 0 and self._in_flight < self._parallelism:
+                    wait = self._take_tokens(tokens, now)
+                    if wait <= 0:
+                        self._in_flight += 1
+                        return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+    
+    def _take_tokens(self, tokens: int, now: float) -> float:
+        """Charge tokens to the bucket; return 0, or the seconds until they're available."""
+        if not self.tokens_per_minute or tokens <= 0:
+            return 0.0
+        rate = self.tokens_per_minute / 60
+        self._tokens = min(self.tokens_per_minute, self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+        needed = min(tokens, self.tokens_per_minute)  # Oversized calls wait for a full bucket
+        if self._tokens >= needed:
+            self._tokens -= needed
+            return 0.0
+        return (needed - self._tokens) / rate
+    
+    def _release(self, succeeded: bool):
+        with self._cond:
+            self._in_flight -= 1
+            if succeeded:
+                self._successes += 1
+                if self._successes >= RATE_LIMIT_RECOVER_AFTER and self._parallelism < self.max_parallelism:
+                    self._parallelism += 1
+                    self._successes = 0
+            self._cond.notify_all()
+    
+    def _back_off(self, error: RateLimitError, attempt: int):
+        delay = _retry_after(error)
+        if delay is None:
+            delay = min(2 ** attempt, 60)
+        with self._cond:
+            self._parallelism = max(1, self._parallelism // 2)
+            self._successes = 0
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            logger.warning(
+                f"Rate limited (attempt {attempt}); pausing {delay:.1f}s, "
+                f"parallelism now {self._parallelism}"
+            )
+            self._cond.notify_all()
+        time.sleep(delay)
+
+
+def _retry_after(error: RateLimitError) -> Optional[float]:
+    """Seconds to wait from a 429's retry-after-ms / Retry-After headers, if present."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass  # HTTP-date form; fall back to exponential backoff
+    return None
+
+
+@lru_cache(maxsize=None)
+def get_rate_controller() -> RateController:
+    """
+    Get the process-wide RateController shared by OpenAI calls made during ingestion.
+    
+    The token budget is read from OPENAI_TPM_LIMIT (unset: concurrency limit only).
+    """
+    tpm = os.getenv("OPENAI_TPM_LIMIT")
+    return RateController(max_parallelism=4, tokens_per_minute=int(tpm) if tpm else None)
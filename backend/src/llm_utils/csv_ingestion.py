@@ -4,12 +4,23 @@ CSV Ingestion
 Functions for ingesting CSV files into the FAISS vectorstore and managing metadata.
 """
 
+import atexit
+import hashlib
+import itertools
+import math
 import os
-import json
+import shutil
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import faiss
+import numpy as np
+import orjson
 import pandas as pd
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 
 from dotenv import load_dotenv
 
@@ -17,7 +28,6 @@ from dotenv import load_dotenv
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
 load_dotenv(PROJECT_ROOT / ".env", override=True)
 
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 
@@ -25,35 +35,224 @@ from general_utils import (
     get_logger,
     # File utilities
     read_tabular_file,
+    read_tabular_chunks,
+    should_stream,
     load_dataset,
+    write_parquet_mirror,
+    remove_parquet_mirror,
+    read_mirror_if_identical,
+    clear_context_cache,
+    format_sample_preview,
     list_available_files,
+    STATS_SAMPLE_ROWS,
     # Paths
     DATABASE_DIR,
     FAISS_DIR,
     FILES_DIR,
+    METADATA_DB,
     METADATA_FILE,
     ensure_dirs,
 )
+from .clients import get_chat_model, get_embeddings, get_rate_controller
+from .query_cache import invalidate_search_caches
 
 logger = get_logger("csv_ingestion")
 
+# Rows embedded and added to FAISS per batch during ingestion
+DEFAULT_INGEST_BATCH_SIZE = 10_000
+
+# Texts per embeddings request, and requests in flight at once during ingestion
+EMBED_REQUEST_SIZE = 1000
+EMBED_CONCURRENCY = 4
+
+# Character budget per embeddings request, keeping each one under the API's
+# ~300k tokens-per-request cap (row texts of numbers and IDs run ~3 chars/token)
+CHARS_PER_TOKEN = 3
+EMBED_REQUEST_MAX_CHARS = 280_000 * CHARS_PER_TOKEN
+
+# ANN index tuning: below IVF_MIN_VECTORS a flat (exact) index is kept, above
+# IVFPQ_MIN_VECTORS the IVF lists are product-quantized to cut memory bandwidth
+IVF_MIN_VECTORS = 10_000
+IVFPQ_MIN_VECTORS = 100_000
+IVF_NPROBE = 8
+
+# Loaded FAISS vectorstore shared across tool calls, with the (mtime_ns, size)
+# of index.faiss it was loaded from or saved as (None until first load)
+_vectorstore_cache: Optional[FAISS] = None
+_vectorstore_signature: Optional[tuple[int, int]] = None
+_vectorstore_lock = threading.Lock()
+
+
+class _ReadWriteLock:
+    """Any number of readers or one writer; a waiting writer holds off new readers."""
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+    
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+    
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+# Ingest and delete modify the shared vectorstore in place. _ingest_lock
+# runs them one at a time (from taking the handle until it is swapped in);
+# _index_rwlock keeps searches and saves out of each individual change.
+_ingest_lock = threading.Lock()
+_index_rwlock = _ReadWriteLock()
+
+# Ingests update the shared vectorstore in memory and save it at most this
+# many seconds later, so back-to-back ingests serialize the index once.
+# Files whose vectors aren't on disk yet are listed in PENDING_SOURCES_FILE
+# until the save, so a crash in between can be spotted and re-ingested.
+VECTORSTORE_SAVE_DELAY = 30
+PENDING_SOURCES_FILE = FAISS_DIR / "pending_sources.json"
+_vectorstore_dirty = False
+_pending_sources: set[str] = set()
+_save_timer: Optional[threading.Timer] = None
+_vectorstore_save_lock = threading.Lock()
+
 
 # =============================================================================
 # Metadata Management
 # =============================================================================
 
-def _load_metadata() -> dict:
-    """Load existing metadata from JSON file."""
-    if METADATA_FILE.exists():
-        with open(METADATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"files": []}
+# Columns of the files table, in record order. JSON_FIELDS hold lists/dicts
+# stored as orjson text; the rest are plain SQLite values.
+_METADATA_FIELDS = (
+    "name", "date_ingested", "description", "row_count", "columns", "file_type",
+    "delimiter", "describe", "head_5", "sample_preview", "content_hash",
+)
+_METADATA_JSON_FIELDS = frozenset({"columns", "describe", "head_5"})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    date_ingested TEXT,
+    description TEXT,
+    row_count INTEGER,
+    columns TEXT,
+    file_type TEXT,
+    delimiter TEXT,
+    describe TEXT,
+    head_5 TEXT,
+    sample_preview TEXT,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS files_content_hash ON files(content_hash);
+"""
+
+# One connection per thread (sqlite3 connections can't be shared across threads)
+_db_local = threading.local()
+_db_init_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    """Return this thread's connection to the metadata database, opening it on first use."""
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        ensure_dirs()
+        conn = sqlite3.connect(METADATA_DB, timeout=30)
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers run alongside a writer (e.g. other API workers)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _db_init_lock:
+            conn.executescript(_SCHEMA)
+            _migrate_json_metadata(conn)
+        _db_local.conn = conn
+    return conn
+
+
+def _migrate_json_metadata(conn: sqlite3.Connection):
+    """Import records from the legacy csv_metadata.json, then rename it to *.bak."""
+    try:
+        with open(METADATA_FILE, "rb") as f:
+            files = orjson.loads(f.read()).get("files", [])
+    except FileNotFoundError:
+        return
+    with conn:
+        for record in files:
+            _upsert_record(conn, record)
+    os.replace(METADATA_FILE, METADATA_FILE.with_name(METADATA_FILE.name + ".bak"))
+    logger.info(f"Migrated {len(files)} metadata records from {METADATA_FILE.name}")
+
+
+def _dumps(value) -> str:
+    """
+    Serialize a JSON field.
+    
+    NaN/inf floats are written as null; values orjson doesn't know natively
+    (e.g. pandas Timestamps in describe stats or samples) are written via str().
+    """
+    return orjson.dumps(
+        value,
+        default=str,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+    ).decode()
+
 
+def _row_to_record(row: sqlite3.Row) -> dict:
+    record = dict(row)
+    for field in _METADATA_JSON_FIELDS:
+        if record[field] is not None:
+            record[field] = orjson.loads(record[field])
+    return record
+
+
+def _upsert_record(conn: sqlite3.Connection, record: dict):
+    values = [
+        _dumps(record.get(field)) if field in _METADATA_JSON_FIELDS else record.get(field)
+        for field in _METADATA_FIELDS
+    ]
+    updates = ", ".join(f"{field} = excluded.{field}" for field in _METADATA_FIELDS[1:])
+    conn.execute(
+        f"INSERT INTO files ({', '.join(_METADATA_FIELDS)}) "
+        f"VALUES ({', '.join('?' * len(_METADATA_FIELDS))}) "
+        f"ON CONFLICT(name) DO UPDATE SET {updates}",
+        values,
+    )
 
-def _save_metadata(metadata: dict):
-    """Save metadata to JSON file."""
-    with open(METADATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2, ensure_ascii=False)
+
+def _save_file_metadata(record: dict):
+    """Insert or replace one file's metadata record (keyed on its name)."""
+    conn = _connect()
+    with conn:
+        _upsert_record(conn, record)
+
+
+def _delete_file_metadata(filename: str) -> bool:
+    """Delete one file's metadata record; return False if there was none."""
+    conn = _connect()
+    with conn:
+        return conn.execute("DELETE FROM files WHERE name = ?", (filename,)).rowcount > 0
 
 
 def get_csv_metadata() -> dict:
@@ -61,9 +260,10 @@ def get_csv_metadata() -> dict:
     Get all CSV metadata.
     
     Returns:
-        Dict containing all file metadata
+        Dict containing all file metadata, in ingestion order
     """
-    return _load_metadata()
+    rows = _connect().execute("SELECT * FROM files ORDER BY rowid").fetchall()
+    return {"files": [_row_to_record(row) for row in rows]}
 
 
 def get_file_metadata(filename: str) -> dict | None:
@@ -76,52 +276,148 @@ def get_file_metadata(filename: str) -> dict | None:
     Returns:
         Dict with file metadata or None if not found
     """
-    metadata = _load_metadata()
-    for f in metadata.get("files", []):
-        if f["name"] == filename:
-            return f
-    return None
+    row = _connect().execute("SELECT * FROM files WHERE name = ?", (filename,)).fetchone()
+    return _row_to_record(row) if row is not None else None
 
 
 # =============================================================================
 # LLM-based Description Generation
 # =============================================================================
 
-def _generate_csv_description(df: pd.DataFrame, filename: str) -> str:
+# Bounds on the summary sent to the LLM for a file description: columns
+# listed with their types, columns with sample rows and statistics, and
+# characters per sample cell. Keeps the prompt under ~8k tokens on wide files.
+DESCRIPTION_MAX_COLUMNS = 100
+DESCRIPTION_DETAIL_COLUMNS = 50
+DESCRIPTION_CELL_CHARS = 60
+
+# Prefix of the fallback description stored when generation fails
+_DESCRIPTION_FAILED_PREFIX = "[Auto-generated description failed"
+
+
+# Row order of _describe() output
+_DESCRIBE_ROWS = ("count", "unique", "mean", "std", "min", "25%", "50%", "75%", "max")
+
+
+def _describe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Summary statistics per column, like df.describe(include='all') without top/freq.
+    
+    Numeric columns are described in one vectorized call; the others only get
+    count and unique, skipping the value_counts() sort pandas runs for every
+    object column to find top/freq.
+    """
+    numeric, other = [], []
+    for i, dtype in enumerate(df.dtypes):
+        (numeric if getattr(dtype, "kind", "O") in "iufc" else other).append(i)
+    
+    parts = []
+    if numeric:
+        parts.append(df.iloc[:, numeric].describe())
+    if other:
+        other_df = df.iloc[:, other]
+        parts.append(pd.DataFrame(
+            [other_df.count().to_numpy(), other_df.nunique().to_numpy()],
+            index=["count", "unique"],
+            columns=other_df.columns,
+        ))
+    if not parts:
+        raise ValueError("Cannot describe a DataFrame without columns")
+    
+    # Back to the frame's column order, then the usual row order
+    stats = pd.concat(parts, axis=1, sort=False).iloc[:, np.argsort(numeric + other, kind="stable")]
+    return stats.reindex([row for row in _DESCRIBE_ROWS if row in stats.index])
+
+
+def _find_existing_description(columns: list, row_count: int, content_hash: Optional[str]) -> Optional[str]:
+    """Return the description of an already-ingested file with identical contents."""
+    if content_hash is None:
+        return None
+    rows = _connect().execute(
+        "SELECT name, columns, description FROM files WHERE content_hash = ? AND row_count = ?",
+        (content_hash, row_count),
+    ).fetchall()
+    for row in rows:
+        description = row["description"]
+        if (
+            description
+            and not description.startswith(_DESCRIPTION_FAILED_PREFIX)
+            and row["columns"] == _dumps(list(columns))
+        ):
+            logger.info(f"Reusing description of identical file '{row['name']}'")
+            return description
+    return None
+
+
+def _generate_csv_description(
+    df: pd.DataFrame,
+    filename: str,
+    describe_df: Optional[pd.DataFrame] = None,
+    row_count: Optional[int] = None,
+) -> str:
     """
     Use ChatOpenAI to generate a description of the CSV file.
     
     Args:
         df: Pandas DataFrame of the CSV
         filename: Name of the CSV file
+        describe_df: Precomputed _describe(df), if the caller
+                     already has it; otherwise statistics are computed here
+        row_count: Rows in the whole file, when df is only its first chunk
         
     Returns:
         Generated description string, or error message if generation fails
     """
     logger.info(f"Generating description for {filename}...")
+    if row_count is None:
+        row_count = len(df)
     
     try:
-        model_name = "gpt-5.1"
-        logger.debug(f"Using LLM: {model_name}")
-        llm = ChatOpenAI(model=model_name, temperature=0)
+        llm = get_chat_model()
+        logger.debug(f"Using LLM: {llm.model_name}")
+        
+        # Build a bounded summary of the data for the LLM: types of at most
+        # DESCRIPTION_MAX_COLUMNS columns, samples and statistics of the first
+        # DESCRIPTION_DETAIL_COLUMNS (over a bounded prefix of long files);
+        # the shape line still reports the full size. Tables are rendered as
+        # TSV by pandas' C CSV writer, not to_string().
+        summary_df = df.iloc[:, :DESCRIPTION_MAX_COLUMNS]
+        detail_df = df.iloc[:, :DESCRIPTION_DETAIL_COLUMNS]
+        columns_note = ""
+        if df.shape[1] > DESCRIPTION_MAX_COLUMNS:
+            columns_note = f" (first {DESCRIPTION_MAX_COLUMNS} of {df.shape[1]} shown)"
+        detail_note = ""
+        if df.shape[1] > DESCRIPTION_DETAIL_COLUMNS:
+            detail_note = f", first {DESCRIPTION_DETAIL_COLUMNS} columns"
         
-        # Build a summary of the data for the LLM
+        stats_label = f"Basic Statistics ({detail_note[2:]})" if detail_note else "Basic Statistics"
         try:
-            stats_str = df.describe(include='all').to_string()
+            if describe_df is None:
+                stats_df = detail_df
+                if len(df) > STATS_SAMPLE_ROWS:
+                    stats_df = detail_df.head(STATS_SAMPLE_ROWS)
+                    stats_label = f"Basic Statistics (first {STATS_SAMPLE_ROWS} rows{detail_note})"
+                describe_df = _describe(stats_df)
+            stats_str = describe_df.iloc[:, :DESCRIPTION_DETAIL_COLUMNS].to_csv(sep='\t', float_format='%.4g')
         except Exception:
             stats_str = "Could not generate statistics"
         
+        # Sample cells are cut to DESCRIPTION_CELL_CHARS so long text columns
+        # don't dominate the prompt
+        sample_df = detail_df.head().astype(str).apply(lambda col: col.str.slice(0, DESCRIPTION_CELL_CHARS))
+        sample_str = sample_df.to_csv(sep='\t', index=False)
+        
         csv_summary = f"""
 Filename: {filename}
-Shape: {df.shape[0]} rows × {df.shape[1]} columns
+Shape: {row_count} rows × {df.shape[1]} columns
 
-Columns and Types:
-{df.dtypes.to_string()}
+Columns and Types{columns_note}:
+{summary_df.dtypes.to_string()}
 
-Sample Data (first 5 rows):
-{df.head().to_string()}
+Sample Data (first 5 rows{detail_note}):
+{sample_str}
 
-Basic Statistics:
+{stats_label}:
 {stats_str}
 """
         
@@ -139,60 +435,334 @@ CSV Summary:
 Provide a clear, structured description in 2-3 paragraphs."""
 
         logger.debug(f"Prompt length: {len(prompt)} chars")
-        response = llm.invoke(prompt)
+        response = get_rate_controller().call(llm.invoke, prompt, tokens=len(prompt) // CHARS_PER_TOKEN)
         logger.info(f"Description generated ({len(response.content)} chars)")
         return response.content
     
     except Exception as e:
         logger.error(f"Description generation failed: {e}", exc_info=True)
-        return f"[Auto-generated description failed: {str(e)}] File contains {len(df)} rows and {len(df.columns)} columns: {', '.join(df.columns.tolist())}"
+        return f"{_DESCRIPTION_FAILED_PREFIX}: {str(e)}] File contains {row_count} rows and {len(df.columns)} columns: {', '.join(df.columns.tolist())}"
+
+
+# Runs description requests alongside ingestion's embedding requests
+_describe_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="describe")
+
+
+def _describe_file(
+    df: pd.DataFrame,
+    filename: str,
+    describe_df: Optional[pd.DataFrame],
+    row_count: int,
+    content_hash: Optional[str],
+) -> str:
+    """Reuse the description of an identical ingested file, or generate one with the LLM."""
+    description = _find_existing_description(list(df.columns), row_count, content_hash)
+    if description is None:
+        description = _generate_csv_description(df, filename, describe_df, row_count)
+    return description
 
 
 # =============================================================================
 # Document Conversion for Vectorstore
 # =============================================================================
 
-def _csv_to_documents(df: pd.DataFrame, filename: str) -> list[Document]:
+class _RowHasher:
+    """
+    Docstore IDs and content hash for a file's rows, fed one chunk at a time.
+    
+    Row IDs are "<filename>:<row hash>:<n>": the hash covers the row's values
+    (not its position) and n numbers repeated identical rows, counted across
+    chunks, so every ID is unique. Re-ingesting unchanged rows yields the same
+    IDs, which lets ingest_file skip re-embedding them. The content hash
+    covers the column names and every row hash, in order.
+    """
+    
+    def __init__(self, filename: str, columns: list):
+        self.filename = filename
+        self._digest = hashlib.blake2b(digest_size=16)
+        self._digest.update(orjson.dumps([str(c) for c in columns]))
+        self._occurrences: dict[int, int] = {}
+        self._failed = False
+    
+    def add(self, df: pd.DataFrame) -> Optional[list[str]]:
+        """
+        Hash the next chunk of rows.
+        
+        Returns:
+            One ID per row, or None if the values can't be hashed (e.g. list cells)
+        """
+        if self._failed:
+            return None
+        try:
+            hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        except Exception as e:
+            logger.debug(f"Could not hash rows of {self.filename}: {e}")
+            self._failed = True
+            return None
+        self._digest.update(hashes.tobytes())
+        
+        occurrences = self._occurrences
+        prefix = self.filename
+        ids = []
+        for h in hashes.tolist():
+            n = occurrences.get(h, 0)
+            occurrences[h] = n + 1
+            ids.append(f"{prefix}:{h:016x}:{n}")
+        return ids
+    
+    def content_hash(self) -> Optional[str]:
+        """Hex digest of everything added, or None if any chunk couldn't be hashed."""
+        return None if self._failed else self._digest.hexdigest()
+
+
+def _csv_to_documents_batched(
+    df: pd.DataFrame,
+    filename: str,
+    batch_size: int = DEFAULT_INGEST_BATCH_SIZE,
+    ids: Optional[list[str]] = None,
+    skip_ids: frozenset[str] = frozenset(),
+) -> Iterator[tuple[list[str], list[dict], Optional[list[str]]]]:
     """
-    Convert CSV rows to LangChain Documents for vectorstore.
+    Convert CSV rows to vectorstore texts and metadatas, one batch at a time.
+    
+    Only one batch of row strings exists at once, so memory stays bounded by
+    batch_size regardless of the file's length. No Document objects are
+    built; the texts and metadatas go straight to FAISS.
     
     Args:
         df: Pandas DataFrame
         filename: Source filename for metadata
+        batch_size: Rows per yielded batch
+        ids: Optional docstore ID per row (see _RowHasher)
+        skip_ids: IDs of rows already in the index; those rows are left out
         
-    Returns:
-        List of Document objects
+    Yields:
+        (texts, metadatas, ids) for each batch of rows (ids is None if not given);
+        batches whose rows are all skipped are not yielded
+    """
+    for start in range(0, len(df), batch_size):
+        batch = df.iloc[start:start + batch_size]
+        batch_ids = ids[start:start + batch_size] if ids is not None else None
+        
+        if batch_ids is not None and skip_ids:
+            keep = [i for i, doc_id in enumerate(batch_ids) if doc_id not in skip_ids]
+            if not keep:
+                continue
+            if len(keep) < len(batch_ids):
+                batch = batch.iloc[keep]
+                batch_ids = [batch_ids[i] for i in keep]
+        
+        # Format each column once ("col: value" strings), then join across
+        # columns per row; no per-row Series is built as with iterrows()
+        formatted_columns = [
+            (f"{col}: " + batch.iloc[:, i].astype(str)).tolist()
+            for i, col in enumerate(batch.columns)
+        ]
+        texts = [" | ".join(parts) for parts in zip(*formatted_columns)]
+        metadatas = [
+            {"source": filename, "row_index": idx}
+            for idx in batch.index.tolist()
+        ]
+        
+        logger.debug(f"Converted {len(texts)} rows from {start} to texts")
+        yield texts, metadatas, batch_ids
+
+
+def _embedding_slices(texts: list[str]) -> Iterator[list[str]]:
     """
-    logger.debug(f"Converting {len(df)} rows to documents")
-    documents = []
+    Split texts into embeddings requests of at most EMBED_REQUEST_SIZE texts
+    and EMBED_REQUEST_MAX_CHARS characters, preserving order.
+    """
+    start = 0
+    chars = 0
+    for i, text in enumerate(texts):
+        if i > start and (i - start >= EMBED_REQUEST_SIZE or chars + len(text) > EMBED_REQUEST_MAX_CHARS):
+            yield texts[start:i]
+            start = i
+            chars = 0
+        chars += len(text)
+    if start < len(texts):
+        yield texts[start:]
+
+
+def _embed_texts(embeddings, texts: list[str]) -> list[list[float]]:
+    """
+    Embed texts with up to EMBED_CONCURRENCY requests in flight.
     
-    for idx, row in df.iterrows():
-        row_text = " | ".join([f"{col}: {val}" for col, val in row.items()])
+    embed_documents() sends its batches one after another; splitting the texts
+    into request-sized slices (see _embedding_slices) and embedding them from a
+    small thread pool overlaps the round trips (the shared HTTP pool is
+    thread-safe). Each request goes through the shared RateController, which
+    narrows the pool's effective concurrency while the API is returning 429s.
+    
+    Args:
+        embeddings: Embeddings client
+        texts: Texts to embed
         
-        doc = Document(
-            page_content=row_text,
-            metadata={
-                "source": filename,
-                "row_index": idx,
-            }
-        )
-        documents.append(doc)
+    Returns:
+        One vector per text, in input order
+    """
+    controller = get_rate_controller()
+    
+    def embed(batch: list[str]) -> list[list[float]]:
+        tokens = sum(len(text) for text in batch) // CHARS_PER_TOKEN
+        return controller.call(embeddings.embed_documents, batch, tokens=tokens)
     
-    logger.debug(f"Created {len(documents)} documents")
-    return documents
+    slices = list(_embedding_slices(texts))
+    if len(slices) <= 1:
+        return embed(texts)
+    
+    with ThreadPoolExecutor(max_workers=min(EMBED_CONCURRENCY, len(slices))) as pool:
+        results = pool.map(embed, slices)
+        return [vector for batch in results for vector in batch]
+
+
+# =============================================================================
+# ANN Index
+# =============================================================================
+
+def _set_nprobe(index):
+    """Set the number of IVF lists probed per query (no-op for flat indexes)."""
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = IVF_NPROBE
+
+
+def _optimize_index(vectorstore: FAISS):
+    """
+    Replace a flat index with an IVF index once it holds enough vectors.
+    
+    Vectors are reconstructed from the current index and re-added in the same
+    order, so the vectorstore's docstore mapping stays valid. An existing
+    IVFFlat index is only rebuilt when it has outgrown its number of lists.
+    
+    Args:
+        vectorstore: FAISS vectorstore whose index is swapped in place
+    """
+    index = vectorstore.index
+    n = index.ntotal
+    if n < IVF_MIN_VECTORS:
+        return
+    
+    # ~4*sqrt(N) lists, capped so k-means gets at least 39 training points per list
+    nlist = min(int(4 * math.sqrt(n)), n // 39)
+    if isinstance(index, faiss.IndexIVFPQ):
+        # PQ codes are lossy, so re-training from them would degrade recall
+        return
+    if isinstance(index, faiss.IndexIVF):
+        if index.nlist >= nlist // 2:
+            return
+        with _index_rwlock.write():
+            index.make_direct_map()
+    
+    d = index.d
+    xb = index.reconstruct_n(0, n)
+    
+    quantizer = faiss.IndexFlatL2(d)
+    if n >= IVFPQ_MIN_VECTORS and d % 8 == 0:
+        new_index = faiss.IndexIVFPQ(quantizer, d, nlist, d // 8, 8)
+    else:
+        new_index = faiss.IndexIVFFlat(quantizer, d, nlist)
+    
+    logger.info(f"Building {type(new_index).__name__} (nlist={nlist}) for {n} vectors...")
+    new_index.train(xb)
+    new_index.add(xb)
+    _set_nprobe(new_index)
+    with _index_rwlock.write():
+        vectorstore.index = new_index
+
+
+def _remove_vectors(vectorstore: FAISS, labels: list[int], doc_ids: list[str]):
+    """
+    Remove vectors (by FAISS label) and their documents from a vectorstore.
+    
+    FAISS.delete() renumbers the remaining labels 0..n-1, which matches flat
+    indexes (remove_ids shifts them down) but not IVF ones, whose inverted
+    lists keep their stored ids. For IVF indexes the stored ids are rewritten
+    to the same compacted numbering.
+    
+    Args:
+        vectorstore: FAISS vectorstore modified in place
+        labels: FAISS labels of the vectors to remove
+        doc_ids: Docstore IDs of the same vectors
+    """
+    with _index_rwlock.write():
+        _remove_vectors_locked(vectorstore, labels, doc_ids)
+
+
+def _remove_doc_ids(vectorstore: FAISS, doc_ids: list[str]):
+    """Remove vectors and their documents from a vectorstore by docstore ID."""
+    wanted = set(doc_ids)
+    labels = [label for label, doc_id in vectorstore.index_to_docstore_id.items() if doc_id in wanted]
+    _remove_vectors(vectorstore, labels, doc_ids)
+
+
+def _remove_vectors_locked(vectorstore: FAISS, labels: list[int], doc_ids: list[str]):
+    index = vectorstore.index
+    old_ntotal = index.ntotal
+    is_ivf = isinstance(index, faiss.IndexIVF)
+    if is_ivf:
+        # remove_ids is not supported with an array direct map
+        index.set_direct_map_type(faiss.DirectMap.NoMap)
+    
+    vectorstore.delete(ids=doc_ids)
+    
+    if is_ivf:
+        keep = np.ones(old_ntotal, dtype=bool)
+        keep[labels] = False
+        new_label = np.cumsum(keep, dtype=np.int64) - 1
+        invlists = index.invlists
+        for list_no in range(index.nlist):
+            size = invlists.list_size(list_no)
+            if size:
+                ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size)
+                ids[:] = new_label[ids]
 
 
 # =============================================================================
 # File Ingestion
 # =============================================================================
 
-def ingest_file(file_path: str, filename: Optional[str] = None) -> dict:
+def _read_unchanged_file(file_path: str, filename: str) -> Optional[tuple[pd.DataFrame, dict]]:
+    """
+    Load a re-ingested file from its stored copy's Parquet mirror.
+    
+    Returns:
+        (DataFrame, file_info) like read_tabular_file, or None if the file is
+        new, its bytes changed, or there is no valid mirror
+    """
+    record = get_file_metadata(filename)
+    if record is None:
+        return None
+    df = read_mirror_if_identical(file_path, filename)
+    if df is None:
+        return None
+    logger.info(f"{filename} is unchanged, loaded from its Parquet mirror")
+    file_info = {
+        "type": record.get("file_type"),
+        "delimiter": record.get("delimiter"),
+        "extension": Path(file_path).suffix.lower(),
+    }
+    return df, file_info
+
+
+def ingest_file(
+    file_path: str,
+    filename: Optional[str] = None,
+    move: bool = False,
+    batch_size: int = DEFAULT_INGEST_BATCH_SIZE,
+) -> dict:
     """
     Ingest a tabular file (CSV, TSV, Excel): generate description, store in FAISS, save metadata.
     
     Args:
         file_path: Path to the file (CSV, TSV, XLSX, XLS)
         filename: Optional custom name (defaults to file basename)
+        move: If True, move file_path into the database instead of copying it.
+              Use for temporary upload files the caller would delete anyway.
+        batch_size: Rows converted, embedded and added to FAISS at a time.
+                    Bounds peak memory for large files; delimited files of
+                    STREAM_MIN_BYTES or more are also read batch_size rows
+                    at a time.
         
     Returns:
         Dict with ingestion results including name, description, and status
@@ -202,66 +772,161 @@ def ingest_file(file_path: str, filename: Optional[str] = None) -> dict:
     
     ensure_dirs()
     
-    # Read the file with auto-detection
-    df, file_info = read_tabular_file(file_path)
-    
     # Determine filename
     if filename is None:
         filename = Path(file_path).name
     logger.info(f"Filename: {filename}")
-    
-    # Save original file to database
-    import shutil
     dest_path = FILES_DIR / filename
-    shutil.copy2(file_path, dest_path)
-    logger.info(f"Saved original file to: {dest_path}")
     
-    # Generate description using LLM
-    description = _generate_csv_description(df, filename)
+    # Large delimited files are streamed: read, converted and embedded one
+    # chunk of batch_size rows at a time instead of parsed into one DataFrame.
+    # Other files identical to their stored copy are loaded from its Parquet
+    # mirror; the rest are read with auto-detection.
+    stream = should_stream(file_path)
+    unchanged = None if stream else _read_unchanged_file(file_path, filename)
+    if unchanged is not None:
+        df, file_info = unchanged
+    elif not stream:
+        df, file_info = read_tabular_file(file_path)
+    
+    # Save original file to database (an identical stored copy is kept as is)
+    if unchanged is not None:
+        if move and not os.path.samefile(file_path, dest_path):
+            os.unlink(file_path)
+        logger.info(f"Stored file unchanged, reusing: {dest_path}")
+    elif move:
+        shutil.move(file_path, dest_path)
+        logger.info(f"Moved original file to: {dest_path}")
+    else:
+        shutil.copy2(file_path, dest_path)
+        logger.info(f"Saved original file to: {dest_path}")
     
-    # Convert to documents
-    documents = _csv_to_documents(df, filename)
+    if stream:
+        # The stored file was replaced without a new mirror (copy2 keeps the
+        # source mtime, so an old mirror could still look current)
+        remove_parquet_mirror(filename)
+        chunks, file_info = read_tabular_chunks(str(dest_path), batch_size)
+        df = next(chunks, None)
+        if df is None:
+            raise ValueError(f"No rows or header found in {filename}")
+        chunks = itertools.chain([df], chunks)
+        # Statistics, the description sample and head_5 come from the first chunk
+        logger.info(f"Streaming {filename}; statistics use the first {len(df)} rows")
+    else:
+        chunks = iter([df])
+        if unchanged is None:
+            # Columnar copy so plot/analytics tools (and re-ingests) skip re-parsing the original
+            write_parquet_mirror(df, filename)
+    
+    # Summary statistics, computed once for both the description and metadata
+    try:
+        describe_df = _describe(df)
+    except Exception:
+        describe_df = None
     
     # Create embeddings and store in FAISS
     logger.info("Creating embeddings...")
     try:
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+        embeddings = get_embeddings()
     except Exception as e:
         logger.error(f"Failed to create embeddings: {e}")
         raise
     
-    # Check if FAISS store already exists
-    faiss_index_path = FAISS_DIR / "index.faiss"
-    
-    if faiss_index_path.exists():
-        logger.info("Loading existing FAISS index...")
-        vectorstore = FAISS.load_local(
-            str(FAISS_DIR), 
-            embeddings,
-            allow_dangerous_deserialization=True
-        )
-        logger.info(f"Adding {len(documents)} documents to existing index...")
-        vectorstore.add_documents(documents)
-    else:
-        logger.info(f"Creating new FAISS index with {len(documents)} documents...")
-        vectorstore = FAISS.from_documents(documents, embeddings)
-    
-    # Save vectorstore
-    vectorstore.save_local(str(FAISS_DIR))
-    logger.info("FAISS index saved")
-    
-    # Update metadata
-    metadata = _load_metadata()
-    
-    existing_idx = next(
-        (i for i, f in enumerate(metadata["files"]) if f["name"] == filename),
-        None
-    )
+    # The shared index is modified in place rather than copied. _ingest_lock
+    # runs ingests and deletes one at a time until the result is the shared
+    # handle again; searches are only held off during each change.
+    with _ingest_lock:
+        vectorstore = get_vectorstore()
+        shared = vectorstore is not None
+        added_ids: list[str] = []  # Vectors this ingest added to the shared index
+        try:
+            # This file's vectors from a previous ingest (docstore ID -> index label)
+            previous: dict[str, int] = {}
+            if vectorstore is not None:
+                for label, doc_id in vectorstore.index_to_docstore_id.items():
+                    doc = vectorstore.docstore.search(doc_id)
+                    if isinstance(doc, Document) and doc.metadata.get("source") == filename:
+                        previous[doc_id] = label
+            previous_ids = frozenset(previous)
+            
+            # Convert and embed rows in batches so only one batch of texts and
+            # vectors is held in memory at a time. Rows already indexed under the
+            # same ID (unchanged since a previous ingest) are kept as they are.
+            hasher = _RowHasher(filename, list(df.columns))
+            hashed_chunks = ((chunk, hasher.add(chunk)) for chunk in chunks)
+            
+            # The description request is network-bound like embedding, so it runs in
+            # the background once the content hash (for reuse) and row count are
+            # final: up front for a fully read file, after the last chunk when streaming
+            description_future = None
+            if not stream:
+                hashed_chunks = iter([(df, hasher.add(df))])
+                description_future = _describe_executor.submit(
+                    _describe_file, df, filename, describe_df, len(df), hasher.content_hash()
+                )
+            
+            kept: set[str] = set()
+            row_count = 0
+            rows_indexed = 0
+            changed = False
+            for chunk, row_ids in hashed_chunks:
+                row_count += len(chunk)
+                if row_ids is not None and previous_ids:
+                    kept.update(previous_ids.intersection(row_ids))
+                
+                for texts, metadatas, ids in _csv_to_documents_batched(chunk, filename, batch_size, row_ids, previous_ids):
+                    vectors = _embed_texts(embeddings, texts)
+                    
+                    # Add the precomputed vectors so FAISS doesn't embed the batch again
+                    if vectorstore is None:
+                        logger.info(f"Creating new FAISS index with {len(texts)} documents...")
+                        vectorstore = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas, ids=ids)
+                    else:
+                        logger.info(f"Adding {len(texts)} documents to index...")
+                        with _index_rwlock.write():
+                            vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+                        if shared:
+                            added_ids.extend(ids)
+                    rows_indexed += len(texts)
+                    changed = True
+            
+            if kept:
+                logger.info(f"{len(kept)} rows unchanged since last ingest, skipped their embeddings")
+            rows_indexed += len(kept)
+            
+            content_hash = hasher.content_hash()
+            if description_future is not None:
+                description = description_future.result()
+            else:
+                description = _describe_file(df, filename, describe_df, row_count, content_hash)
+            
+            # Previous vectors of this file whose rows are gone or changed are stale
+            # (removed last, as they can't be restored if the ingest fails)
+            stale_ids = [doc_id for doc_id in previous if doc_id not in kept]
+            if stale_ids:
+                logger.info(f"Removing {len(stale_ids)} stale vectors of {filename}...")
+                _remove_vectors(vectorstore, [previous[doc_id] for doc_id in stale_ids], stale_ids)
+                changed = True
+        except BaseException:
+            if added_ids:
+                logger.warning(f"Ingest of {filename} failed; removing its {len(added_ids)} new vectors")
+                _remove_doc_ids(vectorstore, added_ids)
+                _update_vectorstore_cache(vectorstore)
+            raise
+        
+        # Save vectorstore and make it the shared handle
+        if vectorstore is not None and changed:
+            if vectorstore.index.ntotal == 0:
+                # Re-ingest of an empty file removed this file's only vectors
+                (FAISS_DIR / "index.faiss").unlink(missing_ok=True)
+                (FAISS_DIR / "index.pkl").unlink(missing_ok=True)
+                _set_vectorstore_cache(None)
+            else:
+                _optimize_index(vectorstore)
+                _update_vectorstore_cache(vectorstore, filename)
     
-    # Safely get describe stats
+    # Safely get describe stats (NaN/inf are serialized as null)
     try:
-        describe_df = df.describe(include='all').fillna("")
-        describe_df = describe_df.replace([float('inf'), float('-inf')], "")
         describe_stats = describe_df.to_dict()
     except Exception:
         describe_stats = {"error": "Could not generate statistics"}
@@ -277,30 +942,28 @@ def ingest_file(file_path: str, filename: Optional[str] = None) -> dict:
         "name": filename,
         "date_ingested": datetime.now().isoformat(),
         "description": description,
-        "row_count": len(df),
+        "row_count": row_count,
         "columns": list(df.columns),
         "file_type": file_info.get("type"),
         "delimiter": file_info.get("delimiter"),
         "describe": describe_stats,
         "head_5": head_5,
+        # Pre-formatted sample rows for the agent's system prompt
+        "sample_preview": format_sample_preview(head_5),
+        # Identifies identical re-ingests so their description can be reused
+        "content_hash": content_hash,
     }
     
-    if existing_idx is not None:
-        metadata["files"][existing_idx] = file_metadata
-        logger.info(f"Updated existing metadata for {filename}")
-    else:
-        metadata["files"].append(file_metadata)
-        logger.info(f"Added new metadata for {filename}")
-    
-    _save_metadata(metadata)
+    _save_file_metadata(file_metadata)
+    logger.info(f"Saved metadata for {filename}")
     
-    logger.info(f"=== Ingestion complete: {len(documents)} rows indexed ===")
+    logger.info(f"=== Ingestion complete: {rows_indexed} rows indexed ===")
     
     return {
         "status": "success",
         "name": filename,
         "description": description,
-        "rows_indexed": len(documents),
+        "rows_indexed": rows_indexed,
         "file_type": file_info.get("type"),
     }
 
@@ -313,27 +976,151 @@ ingest_csv = ingest_file
 # Vectorstore Access
 # =============================================================================
 
+def _index_signature() -> Optional[tuple[int, int]]:
+    """Return (mtime_ns, size) of the saved FAISS index, or None if there is none."""
+    try:
+        stat = os.stat(FAISS_DIR / "index.faiss")
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _set_vectorstore_cache(vectorstore: Optional[FAISS]):
+    """
+    Replace the shared vectorstore handle with one matching the files on disk
+    (None forces a reload on next access). Discards unsaved changes.
+    """
+    global _vectorstore_cache, _vectorstore_signature, _vectorstore_dirty
+    with _vectorstore_lock:
+        _vectorstore_cache = vectorstore
+        _vectorstore_signature = _index_signature() if vectorstore is not None else None
+        _vectorstore_dirty = False
+        _clear_pending_sources()
+    invalidate_search_caches()
+
+
+def _update_vectorstore_cache(vectorstore: FAISS, source: Optional[str] = None):
+    """
+    Make a modified vectorstore the shared handle and schedule saving it.
+    
+    Args:
+        vectorstore: Vectorstore with changes not yet saved to FAISS_DIR
+        source: Ingested file whose vectors are unsaved (recorded until the save)
+    """
+    global _vectorstore_cache, _vectorstore_dirty, _save_timer
+    with _vectorstore_lock:
+        _vectorstore_cache = vectorstore
+        _vectorstore_dirty = True
+        if source is not None and source not in _pending_sources:
+            _pending_sources.add(source)
+            PENDING_SOURCES_FILE.write_bytes(orjson.dumps(sorted(_pending_sources)))
+        if _save_timer is None:
+            _save_timer = threading.Timer(VECTORSTORE_SAVE_DELAY, flush_vectorstore)
+            _save_timer.daemon = True
+            _save_timer.start()
+    invalidate_search_caches()
+
+
+def _clear_pending_sources():
+    """Forget unsaved sources (caller holds _vectorstore_lock)."""
+    if _pending_sources:
+        _pending_sources.clear()
+        PENDING_SOURCES_FILE.unlink(missing_ok=True)
+
+
+def flush_vectorstore():
+    """
+    Save the shared vectorstore to disk if it has unsaved changes.
+    
+    Runs on a timer after ingests and at interpreter exit; call it directly
+    before handing the index to another process.
+    """
+    global _vectorstore_signature, _vectorstore_dirty, _save_timer
+    with _vectorstore_save_lock:
+        with _vectorstore_lock:
+            if _save_timer is not None:
+                _save_timer.cancel()
+                _save_timer = None
+            if not _vectorstore_dirty:
+                return
+            vectorstore = _vectorstore_cache
+        
+        # Ingest/delete change the shared handle in place; holding the read
+        # side keeps those changes out until the save is recorded
+        with _index_rwlock.read():
+            vectorstore.save_local(str(FAISS_DIR))
+            
+            with _vectorstore_lock:
+                if _vectorstore_cache is vectorstore:
+                    _vectorstore_signature = _index_signature()
+                    _vectorstore_dirty = False
+                    _clear_pending_sources()
+        logger.info("FAISS index saved")
+
+
+atexit.register(flush_vectorstore)
+
+
+def reset_vectorstore_cache():
+    """
+    Drop the cached vectorstore so the next access reloads it from disk.
+    
+    Unsaved changes are saved first. Use when the index may have been
+    changed by another process.
+    """
+    logger.debug("Resetting cached FAISS vectorstore")
+    flush_vectorstore()
+    _set_vectorstore_cache(None)
+
+
+@contextmanager
+def reading_vectorstore():
+    """Hold off in-place changes by ingest/delete while searching the shared vectorstore."""
+    with _index_rwlock.read():
+        yield
+
+
 def get_vectorstore() -> Optional[FAISS]:
     """
-    Load and return the FAISS vectorstore.
+    Return the FAISS vectorstore, loading it from disk on first access.
+    
+    The loaded index is cached and reused while index.faiss keeps the same
+    mtime and size, so an index rewritten by another worker process is
+    picked up on the next access. Ingest and delete in this process replace
+    the cached handle in place; while it has unsaved changes it is returned
+    without checking the files on disk. Read it inside reading_vectorstore().
     
     Returns:
         FAISS vectorstore or None if not exists
     """
-    faiss_index_path = FAISS_DIR / "index.faiss"
+    global _vectorstore_cache, _vectorstore_signature
+    signature = _index_signature()
     
-    if not faiss_index_path.exists():
-        logger.warning("FAISS index does not exist")
-        return None
+    with _vectorstore_lock:
+        if _vectorstore_cache is not None and (_vectorstore_dirty or _vectorstore_signature == signature):
+            return _vectorstore_cache
+        
+        if signature is None:
+            logger.warning("FAISS index does not exist")
+            _vectorstore_cache = _vectorstore_signature = None
+            return None
+        
+        logger.debug("Loading FAISS vectorstore...")
+        vectorstore = FAISS.load_local(
+            str(FAISS_DIR),
+            get_embeddings(),
+            allow_dangerous_deserialization=True
+        )
+        _set_nprobe(vectorstore.index)
+        _vectorstore_cache, _vectorstore_signature = vectorstore, signature
+        logger.debug("FAISS vectorstore loaded")
+        
+        if PENDING_SOURCES_FILE.exists() and not _pending_sources:
+            pending = orjson.loads(PENDING_SOURCES_FILE.read_bytes())
+            logger.warning(f"Index may be missing vectors of {pending} (unsaved at shutdown); re-ingest them")
     
-    logger.debug("Loading FAISS vectorstore...")
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-    vectorstore = FAISS.load_local(
-        str(FAISS_DIR),
-        embeddings,
-        allow_dangerous_deserialization=True
-    )
-    logger.debug("FAISS vectorstore loaded")
+    # The loaded index may differ from the one cached search results came from
+    invalidate_search_caches()
     return vectorstore
 
 
@@ -355,61 +1142,48 @@ def delete_file(filename: str) -> dict:
         ValueError: If file not found in metadata
     """
     logger.info(f"Deleting file: {filename}")
-    metadata = _load_metadata()
-    
-    file_exists = any(f["name"] == filename for f in metadata.get("files", []))
     
-    if not file_exists:
+    # Remove from metadata
+    if not _delete_file_metadata(filename):
         logger.error(f"File '{filename}' not found in metadata")
         raise ValueError(f"File '{filename}' not found in metadata")
-    
-    # Remove from metadata
-    metadata["files"] = [f for f in metadata["files"] if f["name"] != filename]
-    _save_metadata(metadata)
+    clear_context_cache()
     logger.info("Removed from metadata")
     
-    # Rebuild FAISS index without the deleted file's vectors
+    # Remove the deleted file's vectors from the shared index in place (no re-embedding)
     faiss_index_path = FAISS_DIR / "index.faiss"
-    
-    if faiss_index_path.exists():
-        logger.info("Rebuilding FAISS index...")
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-        vectorstore = FAISS.load_local(
-            str(FAISS_DIR),
-            embeddings,
-            allow_dangerous_deserialization=True
-        )
-        
-        docstore = vectorstore.docstore
-        index_to_id = vectorstore.index_to_docstore_id
-        
-        remaining_docs = []
-        for idx, doc_id in index_to_id.items():
-            doc = docstore.search(doc_id)
-            if doc and doc.metadata.get("source") != filename:
-                remaining_docs.append(doc)
-        
-        logger.info(f"Keeping {len(remaining_docs)} documents from other files")
-        
-        # Delete old index
-        if faiss_index_path.exists():
-            os.unlink(faiss_index_path)
-        pkl_path = FAISS_DIR / "index.pkl"
-        if pkl_path.exists():
-            os.unlink(pkl_path)
+    with _ingest_lock:
+        vectorstore = get_vectorstore()
         
-        # Rebuild with remaining documents (if any)
-        if remaining_docs:
-            new_vectorstore = FAISS.from_documents(remaining_docs, embeddings)
-            new_vectorstore.save_local(str(FAISS_DIR))
-            logger.info("FAISS index rebuilt")
-        else:
-            logger.info("No remaining documents, index cleared")
+        if vectorstore is not None:
+            docstore = vectorstore.docstore
+            labels, doc_ids = [], []
+            for label, doc_id in vectorstore.index_to_docstore_id.items():
+                doc = docstore.search(doc_id)
+                if isinstance(doc, Document) and doc.metadata.get("source") == filename:
+                    labels.append(label)
+                    doc_ids.append(doc_id)
+            
+            if doc_ids:
+                logger.info(f"Removing {len(doc_ids)} vectors from FAISS index...")
+                _remove_vectors(vectorstore, labels, doc_ids)
+            
+            if vectorstore.index.ntotal == 0:
+                faiss_index_path.unlink(missing_ok=True)
+                (FAISS_DIR / "index.pkl").unlink(missing_ok=True)
+                _set_vectorstore_cache(None)
+                logger.info("No remaining documents, index cleared")
+            elif doc_ids:
+                # Deletes are saved right away so other processes stop returning the file's rows
+                _optimize_index(vectorstore)
+                _update_vectorstore_cache(vectorstore)
+                flush_vectorstore()
+                logger.info(f"FAISS index updated ({vectorstore.index.ntotal} vectors remain)")
     
     logger.info(f"File '{filename}' deleted successfully")
     
     return {
         "status": "deleted",
         "name": filename,
-        "remaining_files": len(metadata["files"]),
+        "remaining_files": _connect().execute("SELECT COUNT(*) FROM files").fetchone()[0],
     }
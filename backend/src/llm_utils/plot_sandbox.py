@@ -0,0 +1,228 @@
+"""
+Plot Sandbox
+
+Runs LLM-generated Plotly code with restricted builtins and imports. Where
+the platform supports it (POSIX), the code runs in a pool of worker
+processes with address-space and CPU-time limits, so a runaway plot fails
+fast instead of pinning or exhausting the API process.
+
+This module only imports pandas and plotly, so the fork server that
+starts the workers can preload it without LangChain, FAISS or the
+logging setup.
+"""
+
+import builtins
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import threading
+from functools import lru_cache
+from multiprocessing import TimeoutError as PoolTimeoutError
+from typing import Optional
+
+import pandas as pd
+
+try:
+    import resource  # POSIX only
+except ImportError:
+    resource = None
+
+logger = logging.getLogger("plotting")
+
+# Worker pool size and the limits applied to each worker
+PLOT_WORKERS = 2
+PLOT_WORKER_MAX_TASKS = 50  # Plots per worker before it is replaced
+PLOT_WORKER_MEMORY_BYTES = 4 << 30
+PLOT_WORKER_CPU_SECONDS = 10
+PLOT_TIMEOUT_SECONDS = 15  # Wall-clock limit for one plot
+# Extra wait before a worker that ignored its limits is presumed stuck
+PLOT_STUCK_GRACE_SECONDS = 5
+
+_TIMEOUT_MESSAGE = (
+    "Plot code exceeded its time limit; simplify the plot "
+    "(fewer traces or points, or aggregate first)"
+)
+
+
+# Top-level packages generated plot code may import; anything else fails
+# fast instead of loading (or running) arbitrary modules
+_ALLOWED_IMPORTS = frozenset({
+    "plotly", "pandas", "numpy", "math", "statistics", "datetime",
+    "re", "itertools", "collections", "textwrap",
+})
+
+# Builtins withheld from plot code (file, process and interpreter access)
+_BLOCKED_BUILTINS = frozenset({
+    "open", "exec", "eval", "compile", "input", "breakpoint", "help",
+    "exit", "quit", "globals", "locals", "vars", "memoryview",
+})
+
+
+def _restricted_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level != 0 or name.partition(".")[0] not in _ALLOWED_IMPORTS:
+        raise ImportError(f"Import of '{name}' is not allowed in plot code")
+    return builtins.__import__(name, globals, locals, fromlist, level)
+
+
+_SAFE_BUILTINS = {
+    name: value for name, value in vars(builtins).items()
+    if name not in _BLOCKED_BUILTINS
+}
+_SAFE_BUILTINS["__import__"] = _restricted_import
+
+
+@lru_cache(maxsize=1)
+def _plot_globals() -> dict:
+    """Restricted builtins and modules exposed to plot code, imported once on first use."""
+    import plotly.express as px
+    import plotly.graph_objects as go
+    import numpy as np
+    
+    return {"__builtins__": _SAFE_BUILTINS, "px": px, "go": go, "pd": pd, "np": np}
+
+
+@lru_cache(maxsize=64)
+def _compile_plot_code(code: str):
+    """Compile plot code, reusing the code object when the same code repeats."""
+    return compile(code, "<plot>", "exec")
+
+
+def run_plot_code(code: str, df: pd.DataFrame) -> str:
+    """Execute Plotly code in this process with restricted builtins and return the figure as JSON."""
+    import plotly.io as pio
+    
+    compiled = _compile_plot_code(code)
+    
+    # Fresh globals per run so figures and names never leak between runs
+    exec_globals = {**_plot_globals(), "df": df}
+    exec_locals = {}
+    
+    exec(compiled, exec_globals, exec_locals)
+    
+    fig = exec_locals.get("fig") or exec_globals.get("fig")
+    if fig is None:
+        raise ValueError("No 'fig' variable created")
+    
+    # Plain figure JSON (rendered client-side by Plotly.js); the figure was
+    # already validated as it was built, so serialization skips re-validation
+    return pio.to_json(fig, validate=False)
+
+
+# =============================================================================
+# Worker Processes
+# =============================================================================
+
+# Last dataset read by this worker: ((path, mtime_ns, size), df)
+_worker_frame: Optional[tuple[tuple, pd.DataFrame]] = None
+
+
+def _on_limit(signum, frame):
+    raise TimeoutError(_TIMEOUT_MESSAGE)
+
+
+def _init_worker():
+    resource.setrlimit(resource.RLIMIT_AS, (PLOT_WORKER_MEMORY_BYTES, PLOT_WORKER_MEMORY_BYTES))
+    # Both limits raise inside the running task, so the worker survives them
+    signal.signal(signal.SIGALRM, _on_limit)
+    signal.signal(signal.SIGXCPU, _on_limit)
+
+
+def _run_in_worker(code: str, data) -> str:
+    """
+    Worker entry point. data is a DataFrame, or the path of a Parquet file
+    holding it; the last file read is kept so repeated plots skip the read.
+    """
+    global _worker_frame
+    
+    # RLIMIT_CPU counts the worker's whole lifetime, so each task moves the
+    # soft limit to the CPU time used so far plus its own budget
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime) + PLOT_WORKER_CPU_SECONDS
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    signal.alarm(PLOT_TIMEOUT_SECONDS)
+    try:
+        if isinstance(data, str):
+            stat = os.stat(data)
+            key = (data, stat.st_mtime_ns, stat.st_size)
+            if _worker_frame is None or _worker_frame[0] != key:
+                _worker_frame = None  # Free the old frame before reading the new one
+                _worker_frame = (key, pd.read_parquet(data, engine="pyarrow"))
+            # Plot code may add or overwrite columns; keep the cached frame intact
+            data = _worker_frame[1].copy()
+        return run_plot_code(code, data)
+    finally:
+        signal.alarm(0)
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """The shared worker pool, started on first use; None where workers are unsupported."""
+    global _pool
+    if resource is None or "forkserver" not in multiprocessing.get_all_start_methods():
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # forkserver: workers fork from a clean single-threaded server
+            # that has already imported pandas and plotly, rather than from
+            # this multi-threaded process
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload([__name__, "plotly.express", "plotly.graph_objects", "plotly.io"])
+            _pool = ctx.Pool(
+                PLOT_WORKERS, initializer=_init_worker, maxtasksperchild=PLOT_WORKER_MAX_TASKS
+            )
+        return _pool
+
+
+def _reset_pool(pool):
+    """Terminate a pool with a stuck worker; the next plot starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.terminate()
+
+
+def execute_plot_code(code: str, df: pd.DataFrame, parquet_path: Optional[str] = None) -> str:
+    """
+    Execute Plotly code in a resource-limited worker and return the figure as JSON.
+    
+    Falls back to running in this process where worker processes are not
+    supported (e.g. Windows).
+    
+    Args:
+        code: Generated plot code; must assign `fig`
+        df: The dataset, exposed to the code as `df`
+        parquet_path: Up-to-date Parquet copy of df; when given, the worker
+            reads it instead of df being pickled across
+    
+    Returns:
+        Figure JSON
+    """
+    try:
+        pool = _get_pool()
+    except Exception as e:
+        logger.warning(f"Plot worker pool unavailable, running in-process: {e}")
+        pool = None
+    if pool is None:
+        return run_plot_code(code, df)
+    
+    # Workers enforce the time limit themselves and raise TimeoutError; not
+    # hearing back well after it means the worker is stuck in native code
+    data = parquet_path if parquet_path is not None else df
+    try:
+        return pool.apply_async(_run_in_worker, (code, data)).get(
+            timeout=PLOT_TIMEOUT_SECONDS + PLOT_STUCK_GRACE_SECONDS
+        )
+    except PoolTimeoutError:
+        logger.warning("Plot worker did not respond; restarting the worker pool")
+        _reset_pool(pool)
+        raise TimeoutError(_TIMEOUT_MESSAGE) from None
@@ -5,51 +5,333 @@ LLM-powered chart generation using Plotly.
 Includes retry logic via conversation history.
 """
 
+import ast
+import difflib
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import pandas as pd
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 
 from general_utils import (
     get_logger,
     load_dataset,
     list_available_files,
-    get_dataset_context,
-    format_context_for_prompt,
+    get_formatted_context,
+    fresh_parquet_mirror,
 )
 from .csv_ingestion import get_file_metadata
+from .clients import get_chat_model, get_embeddings
+from .plot_sandbox import execute_plot_code
+from .query_cache import QueryCache, SemanticQueryCache
 
 logger = get_logger("plotting")
 
 MAX_RETRIES = 3
+# Fixes sampled per retry (one API call) and their temperature, so they differ
+RETRY_CANDIDATES = 2
+RETRY_CANDIDATE_TEMPERATURE = 0.3
+
+PLOT_INSTRUCTIONS = """You are a Python data visualization expert. Generate Plotly code for the dataset described below.
+
+REQUIREMENTS:
+1. Use Plotly Express or Graph Objects
+2. DataFrame is loaded as `df`
+3. Store figure in variable `fig`
+4. Do NOT call fig.show()
+5. Use template="plotly_dark"
+6. Only use columns that exist in the dataset below
+7. Return ONLY Python code, no markdown or explanations"""
+
+# Cosine similarity above which an earlier request's code is reused
+PLOT_CACHE_THRESHOLD = 0.95
+PLOT_CACHE_EMBEDDING_MODEL = "text-embedding-3-small"
+# Semantic caches kept in memory (one per schema and request signature), and
+# requests per cache
+PLOT_CACHE_SCHEMAS = 32
+PLOT_CACHE_REQUESTS = 256
+
+# Chart types; requests only share cached code when they name the same ones
+_CHART_TYPES = frozenset({
+    "bar", "line", "scatter", "pie", "histogram", "box", "violin", "heatmap",
+    "area", "bubble", "sunburst", "treemap", "funnel", "map", "density",
+    "3d", "polar", "candlestick", "waterfall", "strip",
+})
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+# Optional opening ```/```python fence, the code, optional closing fence
+_CODE_FENCE = re.compile(r"^\s*(?:```(?:python|py)?[ \t]*\n?)?(.*?)\s*(?:```)?\s*$", re.DOTALL)
+
+
+def _fenced_block(text: str) -> Optional[str]:
+    """The leading ``` code block of text through its closing fence, or None if there is none."""
+    text = text.lstrip()
+    if not text.startswith("```"):
+        return None
+    end = text.find("```", 3)
+    return text[:end + 3] if end != -1 else None
 
 
 def _clean_code(code: str) -> str:
-    """Remove markdown formatting from code."""
-    if code.startswith("```python"):
-        code = code[9:]
-    if code.startswith("```"):
-        code = code[3:]
-    if code.endswith("```"):
-        code = code[:-3]
-    return code.strip()
+    """Remove markdown formatting, and any prose after a closing fence, from code."""
+    code = _fenced_block(code) or code
+    return _CODE_FENCE.match(code).group(1).strip()
 
 
-def _execute_plot_code(code: str, df: pd.DataFrame) -> str:
-    """Execute Plotly code and return HTML."""
-    import plotly.express as px
-    import plotly.graph_objects as go
-    import numpy as np
+def _stream_plot_code(llm, messages) -> str:
+    """
+    Stream the LLM reply, stopping as soon as a fenced code block closes.
     
-    exec_globals = {"df": df, "px": px, "go": go, "pd": pd, "np": np}
-    exec_locals = {}
+    The prompt asks for bare code, but replies that fence it often follow
+    the closing fence with an explanation; stopping there saves generating
+    (and paying for) those tokens. Unfenced replies are read to the end,
+    since there is no safe point to cut them short.
+    """
+    parts = []
+    fenced = None
+    stream = llm.stream(messages)
+    try:
+        for chunk in stream:
+            parts.append(chunk.content)
+            if fenced is None and "".join(parts).strip():
+                fenced = "".join(parts).lstrip().startswith("`")
+            if fenced and "`" in chunk.content:
+                block = _fenced_block("".join(parts))
+                if block is not None:
+                    return block
+    finally:
+        stream.close()
+    return "".join(parts)
+
+
+# Plotly Express keyword arguments that name columns of data_frame
+_PX_COLUMN_ARGS = frozenset({
+    "x", "y", "z", "color", "symbol", "size", "text", "facet_row", "facet_col",
+    "hover_name", "hover_data", "custom_data", "line_group", "line_dash",
+    "animation_frame", "animation_group", "names", "values", "parents", "ids",
+    "path", "r", "theta", "lat", "lon", "locations", "error_x", "error_y",
+    "base", "pattern_shape", "dimensions",
+})
+
+# difflib ratio above which an unknown column is repaired to the closest real one
+_COLUMN_REPAIR_CUTOFF = 0.8
+
+# DataFrame methods and indexers through which code can add or rename columns
+# of df in place; code using them on df is not checked
+_DF_MUTATING_METHODS = frozenset({
+    "insert", "rename", "eval", "assign", "pop", "set_index", "reset_index",
+})
+_DF_INDEXERS = frozenset({"loc", "iloc", "at", "iat"})
+
+
+def _string_constants(node: ast.AST) -> list[ast.Constant]:
+    """String literal nodes in a single constant or a list/tuple of them."""
+    items = node.elts if isinstance(node, (ast.List, ast.Tuple)) else [node]
+    return [n for n in items if isinstance(n, ast.Constant) and isinstance(n.value, str)]
+
+
+def _is_df(node: ast.AST) -> bool:
+    return isinstance(node, ast.Name) and node.id == "df"
+
+
+def _assigned_names(tree: ast.AST) -> set[str]:
+    """
+    Names the code may create as columns on any frame: string keys of
+    subscript stores, keyword argument names (assign/agg), string values of
+    dict literals (rename mappings) and name= arguments.
+    """
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Store):
+            names.update(c.value for c in _string_constants(node.slice))
+        elif isinstance(node, ast.Call):
+            for kw in node.keywords:
+                if kw.arg is not None:
+                    names.add(kw.arg)
+                if kw.arg == "name":
+                    names.update(c.value for c in _string_constants(kw.value))
+        elif isinstance(node, ast.Dict):
+            names.update(c.value for v in node.values if v is not None for c in _string_constants(v))
+    return names
+
+
+def _mutates_df(node: ast.AST) -> bool:
+    """Whether node rebinds df or may change its columns in place."""
+    if isinstance(node, ast.Name):
+        return node.id == "df" and isinstance(node.ctx, ast.Store)
+    if isinstance(node, ast.Attribute) and _is_df(node.value):
+        return isinstance(node.ctx, ast.Store)  # df.attr = ...
+    if isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Store):
+        target = node.value  # df.loc[...] = ...
+        return isinstance(target, ast.Attribute) and _is_df(target.value) and target.attr in _DF_INDEXERS
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        return _is_df(node.func.value) and node.func.attr in _DF_MUTATING_METHODS
+    return False
+
+
+def _check_columns(code: str, columns) -> tuple[str, list[str]]:
+    """
+    Statically check column references in plot code against the dataset.
+    
+    Covers df["col"] / df[["a", "b"]] reads and the column arguments of px.*
+    calls made directly on df. Near-miss names are rewritten to the closest
+    real column unless the code itself creates a column by that name. Code
+    that reassigns df or may change its columns in place (df.loc stores,
+    insert, rename, ...) is not checked.
+    
+    Returns:
+        The (possibly repaired) code and the names that matched no column
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code, []  # Let exec report it
     
-    exec(code, exec_globals, exec_locals)
+    known = {c for c in columns if isinstance(c, str)}
+    references = []
+    for node in ast.walk(tree):
+        if _mutates_df(node):
+            return code, []
+        if isinstance(node, ast.Subscript) and _is_df(node.value):
+            constants = _string_constants(node.slice)
+            if isinstance(node.ctx, ast.Store):
+                known.update(c.value for c in constants)  # New column
+            else:
+                references.extend(constants)
+        elif (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and isinstance(node.func.value, ast.Name)
+            and node.func.value.id == "px"
+        ):
+            on_df = (node.args and _is_df(node.args[0])) or any(
+                kw.arg == "data_frame" and _is_df(kw.value) for kw in node.keywords
+            )
+            if on_df:
+                for kw in node.keywords:
+                    if kw.arg in _PX_COLUMN_ARGS:
+                        references.extend(_string_constants(kw.value))
     
-    fig = exec_locals.get("fig") or exec_globals.get("fig")
-    if fig is None:
-        raise ValueError("No 'fig' variable created")
+    unknown = []
+    repaired = False
+    assigned = None
+    for ref in references:
+        if ref.value in known:
+            continue
+        if assigned is None:
+            assigned = _assigned_names(tree)
+        if ref.value in assigned:
+            continue  # Created by the code itself; leave it to exec
+        match = difflib.get_close_matches(ref.value, known, n=1, cutoff=_COLUMN_REPAIR_CUTOFF)
+        if match:
+            logger.info(f"Repaired column reference {ref.value!r} -> {match[0]!r}")
+            ref.value = match[0]
+            repaired = True
+        elif ref.value not in unknown:
+            unknown.append(ref.value)
     
-    return fig.to_html(include_plotlyjs="cdn", full_html=False)
+    return (ast.unparse(tree) if repaired else code), unknown
+
+
+# =============================================================================
+# Plot Code Cache
+# =============================================================================
+
+# Working code by (request, schema), then by request meaning among requests
+# on the same schema that name the same chart types and columns
+_plot_code_cache = QueryCache(max_size=2000, ttl_seconds=24 * 3600)
+_semantic_plot_caches: OrderedDict[str, SemanticQueryCache] = OrderedDict()
+_semantic_plot_lock = threading.Lock()
+# Embeds and stores requests after a plot is returned, off the request path
+_plot_cache_executor = ThreadPoolExecutor(1, thread_name_prefix="plot-cache")
+
+
+def _schema_key(df: pd.DataFrame, filename: str) -> str:
+    """Fingerprint of a file's column names and dtypes; cached code is only valid for the same schema."""
+    return QueryCache.make_key(filename, *(f"{col}:{dtype}" for col, dtype in df.dtypes.items()))
+
+
+def _semantic_key(plot_request: str, schema_key: str, columns) -> str:
+    """
+    Key of the semantic cache a request belongs to: its schema plus the chart
+    types and columns it names, so "bar chart of X by Y" never reuses code
+    for "line chart of X by Y" or "bar chart of Z by Y".
+    """
+    text = plot_request.lower()
+    words = set(_WORD.findall(text))
+    words |= {w[:-1] for w in words if w.endswith("s")}  # bars -> bar
+    charts = sorted(words & _CHART_TYPES)
+    named = sorted(
+        str(c) for c in columns
+        if str(c).lower() in text or str(c).lower().replace("_", " ") in text
+    )
+    return QueryCache.make_key(schema_key, *charts, "\x01", *named)
+
+
+def _semantic_plot_cache(key: str, create: bool) -> Optional[SemanticQueryCache]:
+    with _semantic_plot_lock:
+        cache = _semantic_plot_caches.get(key)
+        if cache is not None:
+            _semantic_plot_caches.move_to_end(key)
+        elif create:
+            cache = SemanticQueryCache(max_size=PLOT_CACHE_REQUESTS, threshold=PLOT_CACHE_THRESHOLD)
+            _semantic_plot_caches[key] = cache
+            while len(_semantic_plot_caches) > PLOT_CACHE_SCHEMAS:
+                _semantic_plot_caches.popitem(last=False)
+        return cache
+
+
+def _embed_plot_request(plot_request: str) -> Optional[list[float]]:
+    """Embed a plot request for the semantic cache; None if the embedding call fails."""
+    try:
+        return get_embeddings(PLOT_CACHE_EMBEDDING_MODEL).embed_query(plot_request)
+    except Exception as e:
+        logger.warning(f"Plot request embedding failed, skipping semantic cache: {e}")
+        return None
+
+
+def _cached_plot_code(
+    plot_request: str, schema_key: str, semantic_key: str
+) -> tuple[Optional[str], Optional[list[float]]]:
+    """
+    Look up code generated earlier for the same or a similar request on this schema.
+    
+    The request is only embedded when a semantic cache already exists for
+    its key, so first requests don't pay for an embedding call.
+    
+    Returns:
+        Cached code (or None) and the request embedding, if one was computed
+    """
+    code = _plot_code_cache.get(_plot_code_cache.make_key(plot_request, schema_key))
+    if code is not None:
+        return code, None
+    
+    cache = _semantic_plot_cache(semantic_key, create=False)
+    if cache is None:
+        return None, None
+    embedding = _embed_plot_request(plot_request)
+    if embedding is None:
+        return None, None
+    return cache.get(embedding), embedding
+
+
+def _store_plot_code(
+    plot_request: str, schema_key: str, semantic_key: str,
+    embedding: Optional[list[float]], code: str,
+):
+    """Cache working code; the request is embedded in the background if it wasn't already."""
+    _plot_code_cache.put(_plot_code_cache.make_key(plot_request, schema_key), code)
+    
+    def store():
+        vec = embedding if embedding is not None else _embed_plot_request(plot_request)
+        if vec is not None:
+            _semantic_plot_cache(semantic_key, create=True).put(vec, code)
+    
+    _plot_cache_executor.submit(store)
 
 
 def create_plot_from_request(plot_request: str, filename: str) -> tuple[str, str]:
@@ -57,6 +339,9 @@ def create_plot_from_request(plot_request: str, filename: str) -> tuple[str, str
     Generate and execute Plotly code with retry logic using conversation history.
     
     On failure, appends the error to the conversation and asks LLM to fix it.
+    Code that worked for the same (or a semantically similar) request on
+    the same dataset schema is re-run first, skipping the LLM.
+    Returns the figure JSON and the code that produced it.
     """
     logger.info(f"=== Plot creation: {plot_request} | File: {filename} ===")
     
@@ -70,57 +355,90 @@ def create_plot_from_request(plot_request: str, filename: str) -> tuple[str, str
     
     logger.info(f"Dataset: {df.shape[0]} rows, {df.shape[1]} columns")
     
+    # Plot code runs in a worker process, which reads the Parquet mirror
+    # rather than having the DataFrame pickled over
+    mirror = fresh_parquet_mirror(filename)
+    parquet_path = str(mirror) if mirror is not None else None
+    
+    # Reuse code from an earlier matching request, re-run on the current data
+    schema_key = _schema_key(df, filename)
+    semantic_key = _semantic_key(plot_request, schema_key, df.columns)
+    cached_code, request_embedding = _cached_plot_code(plot_request, schema_key, semantic_key)
+    if cached_code is not None:
+        try:
+            fig_json = execute_plot_code(cached_code, df, parquet_path)
+            logger.info("=== Plot created from cached code ===")
+            return fig_json, cached_code
+        except Exception as e:
+            logger.warning(f"Cached code failed ({type(e).__name__}: {e}), regenerating")
+    
     # Get file metadata (includes delimiter, file_type)
     file_metadata = get_file_metadata(filename)
     
-    # Build context and initial prompt
-    context_str = format_context_for_prompt(get_dataset_context(df, filename, file_metadata))
+    # Build context (memoized per file version)
+    context_str = get_formatted_context(df, filename, file_metadata)
     
-    system_prompt = f"""You are a Python data visualization expert. Generate Plotly code.
-
-{context_str}
-
-REQUIREMENTS:
-1. Use Plotly Express or Graph Objects
-2. DataFrame is loaded as `df`
-3. Store figure in variable `fig`
-4. Do NOT call fig.show()
-5. Use template="plotly_dark"
-6. Only use columns that exist in the dataset above
-7. Return ONLY Python code, no markdown or explanations"""
-
-    # Initialize conversation
-    messages = [HumanMessage(content=f"{system_prompt}\n\nUSER REQUEST: {plot_request}")]
+    # Static instructions and dataset context go first, in a system message
+    # that never changes across retries, so OpenAI's prompt caching can serve
+    # the whole prefix; only the request and error feedback vary
+    messages = [
+        SystemMessage(content=f"{PLOT_INSTRUCTIONS}\n\n{context_str}"),
+        HumanMessage(content=f"USER REQUEST: {plot_request}"),
+    ]
     
-    llm = ChatOpenAI(model="gpt-5.1", temperature=0)
-    code = None
+    llm = get_chat_model()
     
     for attempt in range(MAX_RETRIES):
         logger.info(f"Attempt {attempt + 1}/{MAX_RETRIES}")
         
-        # Get code from LLM
-        response = llm.invoke(messages)
-        code = _clean_code(response.content)
-        messages.append(AIMessage(content=response.content))
-        
-        logger.debug(f"Generated code:\n{code}")
+        # Get code from LLM: one streamed reply first, then several sampled
+        # fixes per retry in a single call (the prompt is billed once)
+        if attempt == 0:
+            candidates = [_stream_plot_code(llm, messages)]
+        else:
+            result = llm.generate(
+                [messages], n=RETRY_CANDIDATES, temperature=RETRY_CANDIDATE_TEMPERATURE
+            )
+            candidates = [g.message.content for g in result.generations[0]]
         
-        # Try to execute
-        try:
-            html = _execute_plot_code(code, df)
-            logger.info("=== Plot created successfully ===")
-            return html, code
-        except Exception as e:
-            error_msg = f"{type(e).__name__}: {str(e)}"
-            logger.warning(f"Attempt {attempt + 1} failed: {error_msg}")
+        failed = None  # (progress, error, reply) of the candidate that got furthest
+        for i, content in enumerate(candidates):
+            code = _clean_code(content)
+            logger.debug(f"Generated code (candidate {i + 1}/{len(candidates)}):\n{code}")
             
-            if attempt < MAX_RETRIES - 1:
-                # Append error and ask for fix
-                messages.append(HumanMessage(
-                    content=f"ERROR: {error_msg}\n\nFix the code. Only use columns that exist. Return ONLY the corrected Python code:"
-                ))
-            else:
-                logger.error(f"All {MAX_RETRIES} attempts failed")
-                raise
+            # Repair near-miss column names, reject unknown ones, then execute
+            unknown_columns = []
+            try:
+                code, unknown_columns = _check_columns(code, df.columns)
+                if unknown_columns:
+                    raise ValueError(
+                        f"Column(s) {', '.join(map(repr, unknown_columns))} not in the dataset; "
+                        "use only the columns listed above"
+                    )
+                fig_json = execute_plot_code(code, df, parquet_path)
+            except Exception as e:
+                logger.warning(f"Attempt {attempt + 1}, candidate {i + 1} failed: {type(e).__name__}: {e}")
+                # Code that ran is closer to working than code that failed
+                # the column check, which is closer than code that didn't parse
+                progress = 0 if isinstance(e, SyntaxError) else 1 if unknown_columns else 2
+                if failed is None or progress > failed[0]:
+                    failed = (progress, e, content)
+                continue
+            
+            _store_plot_code(plot_request, schema_key, semantic_key, request_embedding, code)
+            logger.info("=== Plot created successfully ===")
+            return fig_json, code
+        
+        # Feed back the error of the candidate that got furthest and ask for a fix
+        _, error, failed_content = failed
+        messages.append(AIMessage(content=failed_content))
+        if attempt < MAX_RETRIES - 1:
+            error_msg = f"{type(error).__name__}: {str(error)}"
+            messages.append(HumanMessage(
+                content=f"ERROR: {error_msg}\n\nFix the code. Only use columns that exist. Return ONLY the corrected Python code:"
+            ))
+        else:
+            logger.error(f"All {MAX_RETRIES} attempts failed")
+            raise error
     
     raise RuntimeError("Plot creation failed")
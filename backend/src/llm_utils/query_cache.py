@@ -0,0 +1,231 @@
+"""
+Query Cache
+
+Caches for agent tool results, so repeated searches skip the embedding
+request and FAISS lookup.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+try:
+    import simsimd  # SIMD int8 cosine kernels (AVX-512/NEON); optional
+except ImportError:
+    simsimd = None
+
+from general_utils import get_logger
+
+logger = get_logger("query_cache")
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache with per-entry TTL expiration.
+    
+    Attributes:
+        max_size: Maximum number of entries before least-recently-used eviction
+        ttl_seconds: Seconds an entry stays valid after being stored
+    """
+    
+    def __init__(self, max_size: int = 2000, ttl_seconds: float = 600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+    
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Build a compact cache key from the parts that identify a query."""
+        raw = "\x00".join(str(p) for p in parts).encode("utf-8")
+        return hashlib.blake2b(raw, digest_size=16).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                self._misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+    
+    def put(self, key: str, value: str):
+        """Store a value, evicting the least recently used entry when full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self):
+        """Drop all entries (call whenever the underlying data changes)."""
+        with self._lock:
+            if self._entries:
+                logger.debug(f"Invalidating {len(self._entries)} cached results")
+            self._entries.clear()
+    
+    def stats(self) -> dict:
+        """Return size and hit/miss counters."""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / total if total else 0.0,
+            }
+
+
+# Rows dequantized per step when probing the semantic cache
+_PROBE_BLOCK_ROWS = 256
+
+
+class SemanticQueryCache:
+    """
+    Cache keyed on query meaning rather than exact text.
+    
+    Stores L2-normalized query embeddings alongside their results, quantized
+    to int8 with a per-row scale (a quarter of the float32 footprint). A
+    lookup scores every cached row against the query; the best match is
+    returned if its cosine similarity clears the threshold. Entries are
+    evicted first-in, first-out once the cache is full.
+    
+    Attributes:
+        max_size: Maximum number of cached queries
+        threshold: Minimum cosine similarity for a hit
+    """
+    
+    def __init__(self, max_size: int = 4096, threshold: float = 0.92):
+        self.max_size = max_size
+        self.threshold = threshold
+        self._matrix: Optional[np.ndarray] = None  # int8 (max_size, dim), allocated on first put
+        self._scales = np.zeros(max_size, dtype=np.float32)  # Per-row dequantization scale
+        self._block: Optional[np.ndarray] = None  # float32 (_PROBE_BLOCK_ROWS, dim) scratch
+        self._sims = np.empty(max_size, dtype=np.float32)  # Reused similarity buffer
+        self._values: list[Optional[str]] = [None] * max_size
+        self._count = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+    
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vec = np.array(embedding, dtype=np.float32)
+        norm = np.sqrt(np.dot(vec, vec))
+        if norm > 0:
+            vec *= 1.0 / norm
+        return vec
+    
+    @staticmethod
+    def _quantize(vec: np.ndarray) -> tuple[np.ndarray, float]:
+        """Quantize a normalized vector to int8, returning it with its scale."""
+        scale = float(np.abs(vec).max()) / 127 or 1.0
+        return np.rint(vec * (1.0 / scale)).astype(np.int8), scale
+    
+    def get(self, embedding) -> Optional[str]:
+        """Return the result of the most similar cached query, if similar enough."""
+        vec = self._normalize(embedding)
+        with self._lock:
+            if self._count == 0 or self._matrix.shape[1] != vec.shape[0]:
+                self._misses += 1
+                return None
+            
+            sims = self._similarities(vec)
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self._misses += 1
+                return None
+            
+            self._hits += 1
+            return self._values[best]
+    
+    def _similarities(self, vec: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of vec against every cached row (caller holds the lock).
+        
+        With simsimd installed, the query is quantized to int8 and scored
+        directly against the int8 rows (cosine is scale-invariant, so the row
+        scales are not needed). Otherwise NumPy's integer matmul does not use
+        BLAS, so rows are dequantized a cache-sized block at a time into
+        float32 scratch and scored with sgemv.
+        """
+        count = self._count
+        sims = self._sims[:count]
+        if simsimd is not None:
+            query, _ = self._quantize(vec)
+            distances = np.asarray(simsimd.cdist(query[np.newaxis], self._matrix[:count], metric="cosine"))
+            np.subtract(1.0, distances[0], out=sims, casting="unsafe")
+            return sims
+        
+        for start in range(0, count, _PROBE_BLOCK_ROWS):
+            stop = min(start + _PROBE_BLOCK_ROWS, count)
+            block = self._block[:stop - start]
+            np.copyto(block, self._matrix[start:stop], casting="unsafe")
+            np.matmul(block, vec, out=sims[start:stop])
+        sims *= self._scales[:count]
+        return sims
+    
+    def put(self, embedding, value: str):
+        """Store a query embedding and its result, overwriting the oldest when full."""
+        vec = self._normalize(embedding)
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vec.shape[0]:
+                self._matrix = np.zeros((self.max_size, vec.shape[0]), dtype=np.int8)
+                self._block = np.empty((_PROBE_BLOCK_ROWS, vec.shape[0]), dtype=np.float32)
+                self._values = [None] * self.max_size
+                self._count = 0
+                self._next = 0
+            
+            quantized, scale = self._quantize(vec)
+            self._matrix[self._next] = quantized
+            self._scales[self._next] = scale
+            self._values[self._next] = value
+            self._next = (self._next + 1) % self.max_size
+            self._count = min(self._count + 1, self.max_size)
+    
+    def invalidate(self):
+        """Drop all entries (call whenever the underlying data changes)."""
+        with self._lock:
+            self._values = [None] * self.max_size
+            self._count = 0
+            self._next = 0
+    
+    def stats(self) -> dict:
+        """Return size and hit/miss counters."""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "size": self._count,
+                "max_size": self.max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / total if total else 0.0,
+            }
+
+
+# Formatted search_data results, invalidated whenever the vectorstore changes
+search_cache = QueryCache()
+semantic_search_cache = SemanticQueryCache()
+
+
+def invalidate_search_caches():
+    """Invalidate both search_data caches."""
+    search_cache.invalidate()
+    semantic_search_cache.invalidate()
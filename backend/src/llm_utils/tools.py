@@ -4,14 +4,170 @@ Agent Tools
 Collection of tools available to the CellByte agent.
 """
 
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+
+import numpy as np
+import orjson
 from langchain_core.tools import tool
-from .csv_ingestion import get_vectorstore
+from .csv_ingestion import get_vectorstore, reading_vectorstore
 from .plotting_utils import create_plot_from_request
 from .analytics_utils import run_analytics
+from .query_cache import search_cache, semantic_search_cache
 from general_utils import get_logger
 
 logger = get_logger("tools")
 
+# Number of documents returned by search_data
+SEARCH_K = 5
+
+# Per-row and total character caps on the text a search returns to the agent
+SEARCH_RESULT_CHARS = 400
+SEARCH_RESPONSE_CHARS = 4096
+
+# Maximum number of queries accepted by search_data_batch
+MAX_BATCH_QUERIES = 8
+
+# Items of a dict result analyze_data shows before truncating
+ANALYSIS_MAX_ITEMS = 10
+
+# Seconds a search_data call waits for concurrent calls to batch with, when
+# another search is already running (a lone search never waits)
+SEARCH_COALESCE_WINDOW = 0.01
+
+
+def _format_search_results(docs: list) -> str:
+    """
+    Format retrieved documents as the text returned to the agent.
+    
+    Rows are grouped under one header per source file (in rank order of each
+    source's first hit), each row is capped at SEARCH_RESULT_CHARS and the
+    whole result at SEARCH_RESPONSE_CHARS to keep the follow-up prompt short.
+    """
+    by_source: dict[str, list[str]] = {}
+    for doc in docs:
+        source = doc.metadata.get("source", "Unknown")
+        content = doc.page_content
+        if len(content) > SEARCH_RESULT_CHARS:
+            content = content[:SEARCH_RESULT_CHARS] + "..."
+        by_source.setdefault(source, []).append(content)
+        logger.debug(f"Result from {source}: {doc.page_content[:100]}...")
+    
+    result = "\n\n".join(
+        f"[From {source}]:\n- " + "\n- ".join(contents)
+        for source, contents in by_source.items()
+    )
+    if len(result) > SEARCH_RESPONSE_CHARS:
+        result = result[:SEARCH_RESPONSE_CHARS] + "\n[truncated]"
+    return result
+
+
+def _search_uncached(vectorstore, queries: list[str]) -> dict[str, str]:
+    """
+    Embed and search several queries together, caching the formatted results.
+    
+    One embedding request covers all queries; those not answered by the
+    semantic cache go through a single FAISS search.
+    
+    Args:
+        vectorstore: The loaded FAISS vectorstore
+        queries: Distinct queries not in the exact-match cache
+        
+    Returns:
+        Formatted result per query
+    """
+    results: dict[str, str] = {}
+    embeddings = vectorstore.embeddings.embed_documents(queries)
+    
+    misses = []
+    for q, emb in zip(queries, embeddings):
+        cached = semantic_search_cache.get(emb)
+        if cached is not None:
+            results[q] = cached
+            search_cache.put(search_cache.make_key(q, SEARCH_K), cached)
+        else:
+            misses.append((q, emb))
+    
+    if misses:
+        xq = np.asarray([emb for _, emb in misses], dtype=np.float32)
+        logger.debug(f"Performing batched similarity search for {len(misses)} queries...")
+        # Ingests change the index in place; the labels are resolved to
+        # documents before the next change can renumber them
+        with reading_vectorstore():
+            _, indices = vectorstore.index.search(xq, SEARCH_K)
+            hits = [
+                [
+                    vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+                    for i in row if i != -1
+                ]
+                for row in indices
+            ]
+        
+        for (q, emb), docs in zip(misses, hits):
+            logger.info(f"Found {len(docs)} matching documents for: {q}")
+            if docs:
+                formatted = _format_search_results(docs)
+                search_cache.put(search_cache.make_key(q, SEARCH_K), formatted)
+                semantic_search_cache.put(emb, formatted)
+            else:
+                formatted = "No relevant data found for your query."
+            results[q] = formatted
+    
+    return results
+
+
+class _SearchCoalescer:
+    """
+    Merges search_data calls that arrive together into one batched search.
+    
+    The agent runs parallel tool calls on separate threads. The first caller
+    to queue becomes the leader: it runs one embedding request and one FAISS
+    search for everything queued and hands each caller its result. A lone
+    search goes straight through; only when another search is already
+    running does the leader wait `window` seconds for more calls to join.
+    """
+    
+    def __init__(self, window: float):
+        self.window = window
+        self._pending: list[tuple[str, Future]] = []
+        self._running = 0  # Batches currently searching
+        self._lock = threading.Lock()
+    
+    def search(self, vectorstore, query: str) -> str:
+        future: Future = Future()
+        with self._lock:
+            self._pending.append((query, future))
+            leader = len(self._pending) == 1
+            wait = leader and self._running > 0
+        
+        if leader:
+            if wait:
+                time.sleep(self.window)
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._running += 1
+            if len(batch) > 1:
+                logger.debug(f"Coalesced {len(batch)} concurrent searches")
+            try:
+                results = _search_uncached(vectorstore, list(dict.fromkeys(q for q, _ in batch)))
+            except Exception as e:
+                for _, f in batch:
+                    f.set_exception(e)
+            else:
+                for q, f in batch:
+                    f.set_result(results[q])
+            finally:
+                with self._lock:
+                    self._running -= 1
+        
+        return future.result()
+
+
+_search_coalescer = _SearchCoalescer(SEARCH_COALESCE_WINDOW)
+
 
 @tool
 def search_data(query: str) -> str:
@@ -33,6 +189,12 @@ def search_data(query: str) -> str:
     """
     logger.info(f"search_data called with query: {query}")
     
+    cache_key = search_cache.make_key(query, SEARCH_K)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Returning cached search result")
+        return cached
+    
     try:
         vectorstore = get_vectorstore()
         
@@ -40,26 +202,61 @@ def search_data(query: str) -> str:
             logger.warning("No vectorstore available")
             return "No data has been ingested yet. Please upload CSV files first."
         
-        # Search for relevant documents
-        logger.debug("Performing similarity search...")
-        docs = vectorstore.similarity_search(query, k=5)
-        logger.info(f"Found {len(docs)} matching documents")
+        # Concurrent calls share one embedding request and FAISS search
+        return _search_coalescer.search(vectorstore, query)
+    
+    except Exception as e:
+        logger.error(f"search_data failed: {e}", exc_info=True)
+        return f"Error searching data: {str(e)}"
+
+
+@tool
+def search_data_batch(queries: list[str]) -> str:
+    """
+    Run several semantic searches over the CSV data in one call.
+    
+    Use this instead of calling search_data repeatedly when you need to look
+    up multiple different things at once (up to 8 queries). Each query
+    returns sample rows, NOT calculations.
+    
+    Args:
+        queries: List of search queries, each describing what data to find
         
-        if not docs:
-            logger.info("No relevant documents found")
-            return "No relevant data found for your query."
+    Returns:
+        JSON list of {"query": ..., "results": ...} objects, one per query
+    """
+    logger.info(f"search_data_batch called with {len(queries)} queries: {queries}")
+    
+    if not queries:
+        return "No queries provided."
+    if len(queries) > MAX_BATCH_QUERIES:
+        return f"Too many queries ({len(queries)}). Pass at most {MAX_BATCH_QUERIES} per call."
+    
+    try:
+        results: dict[str, str] = {}
+        for q in queries:
+            cached = search_cache.get(search_cache.make_key(q, SEARCH_K))
+            if cached is not None:
+                results[q] = cached
         
-        # Format results
-        results = []
-        for doc in docs:
-            source = doc.metadata.get("source", "Unknown")
-            results.append(f"[From {source}]: {doc.page_content}")
-            logger.debug(f"Result from {source}: {doc.page_content[:100]}...")
+        pending = [q for q in dict.fromkeys(queries) if q not in results]
+        if pending:
+            vectorstore = get_vectorstore()
+            
+            if vectorstore is None:
+                logger.warning("No vectorstore available")
+                return "No data has been ingested yet. Please upload CSV files first."
+            
+            results.update(_search_uncached(vectorstore, pending))
         
-        return "\n\n".join(results)
+        logger.info(f"Batch search completed for {len(queries)} queries")
+        return orjson.dumps(
+            [{"query": q, "results": results[q]} for q in queries],
+            option=orjson.OPT_INDENT_2,
+        ).decode()
     
     except Exception as e:
-        logger.error(f"search_data failed: {e}", exc_info=True)
+        logger.error(f"search_data_batch failed: {e}", exc_info=True)
         return f"Error searching data: {str(e)}"
 
 
@@ -96,13 +293,11 @@ def analyze_data(analysis_request: str, filename: str) -> str:
         
         # Format data nicely
         if isinstance(data, dict):
-            if len(data) <= 10:
-                data_str = "\n".join([f"  {k}: {v}" for k, v in data.items()])
-            else:
-                # Truncate if too many items
-                items = list(data.items())[:10]
-                data_str = "\n".join([f"  {k}: {v}" for k, v in items])
-                data_str += f"\n  ... and {len(data) - 10} more items"
+            # Only the first items are formatted; the rest are just counted
+            items = itertools.islice(data.items(), ANALYSIS_MAX_ITEMS)
+            data_str = "\n".join(f"  {k}: {v}" for k, v in items)
+            if len(data) > ANALYSIS_MAX_ITEMS:
+                data_str += f"\n  ... and {len(data) - ANALYSIS_MAX_ITEMS} more items"
         else:
             data_str = str(data)
         
@@ -118,13 +313,20 @@ def analyze_data(analysis_request: str, filename: str) -> str:
         return f"Error analyzing data: {str(e)}"
 
 
+@lru_cache(maxsize=1)
+def _plotlyjs_version() -> str:
+    """Plotly.js version bundled with the installed plotly package."""
+    from plotly.offline import get_plotlyjs_version
+    return get_plotlyjs_version()
+
+
 @tool
 def create_plot(plot_request: str, filename: str) -> str:
     """
     Create a Plotly visualization based on a natural language request.
     
     Use this tool when the user asks for charts, graphs, visualizations,
-    or plots of their data. Returns an HTML string containing the interactive plot.
+    or plots of their data. Returns the interactive plot for the UI to render.
     
     Args:
         plot_request: Natural language description of the desired plot
@@ -132,21 +334,18 @@ def create_plot(plot_request: str, filename: str) -> str:
         filename: Name of the CSV file to use for the plot
         
     Returns:
-        HTML string containing the Plotly chart, or error message
+        Plotly figure JSON wrapped in [PLOT_JSON] tags, or error message
     """
     logger.info(f"create_plot called - request: '{plot_request}', file: '{filename}'")
     
     try:
-        html, code = create_plot_from_request(plot_request, filename)
-        logger.info(f"Plot generated successfully ({len(html)} chars HTML)")
+        fig_json, code = create_plot_from_request(plot_request, filename)
+        logger.info(f"Plot generated successfully ({len(fig_json)} chars JSON)")
         logger.debug(f"Generated code:\n{code}")
         
-        # Wrap in a container with styling
-        html_wrapped = f'''<div class="plot-container" style="width:100%; min-height:400px; background:#1a1a2e; border-radius:8px; padding:10px;">
-        {html}
-        </div>'''
-        
-        return f"[PLOT_HTML]{html_wrapped}[/PLOT_HTML]"
+        # The UI renders the figure with the Plotly.js version it was built for
+        payload = f'{{"plotlyjs_version": "{_plotlyjs_version()}", "figure": {fig_json}}}'
+        return f"[PLOT_JSON]{payload}[/PLOT_JSON]"
     
     except FileNotFoundError as e:
         logger.error(f"File not found: {e}")
@@ -157,4 +356,4 @@ def create_plot(plot_request: str, filename: str) -> str:
 
 
 # List of all available tools for easy import
-ALL_TOOLS = [search_data, analyze_data, create_plot]
+ALL_TOOLS = [search_data, search_data_batch, analyze_data, create_plot]
@@ -15,9 +15,10 @@ export default function ToolCallDisplay({ toolCallMessage, toolResults }: ToolCa
     return toolResults.find(result => result.tool_call_id === toolCallId);
   };
   
-  // Check if the result contains a plot HTML
+  // Check if the result contains a plot (figure JSON, or HTML from older results)
   const isPlotResult = (content: string) => {
-    return content.includes('[PLOT_HTML]') && content.includes('[/PLOT_HTML]');
+    return (content.includes('[PLOT_JSON]') && content.includes('[/PLOT_JSON]'))
+      || (content.includes('[PLOT_HTML]') && content.includes('[/PLOT_HTML]'));
   };
   
   // Extract plot HTML from the result
@@ -26,6 +27,12 @@ export default function ToolCallDisplay({ toolCallMessage, toolResults }: ToolCa
     return match ? match[1] : null;
   };
   
+  // Extract the plot payload ({plotlyjs_version, figure}) from the result
+  const extractPlotJson = (content: string) => {
+    const match = content.match(/\[PLOT_JSON\]([\s\S]*?)\[\/PLOT_JSON\]/);
+    return match ? match[1] : null;
+  };
+  
   // Build a full HTML document for the iframe
   const buildPlotDocument = (plotHtml: string) => {
     return `
@@ -56,13 +63,43 @@ export default function ToolCallDisplay({ toolCallMessage, toolResults }: ToolCa
 </html>`;
   };
   
+  // Build the iframe document that renders figure JSON with Plotly.js
+  const buildPlotJsonDocument = (plotJson: string) => {
+    let version = '2.27.0';
+    try {
+      const parsed = JSON.parse(plotJson).plotlyjs_version;
+      if (typeof parsed === 'string' && /^[0-9.]+$/.test(parsed)) {
+        version = parsed;
+      }
+    } catch {
+      // Malformed payload: Plotly.newPlot below reports it inside the iframe
+    }
+    // '<' only occurs inside JSON strings, where \u003c is an equivalent escape;
+    // this keeps a '</script>' in the data from closing the tag early
+    const safeJson = plotJson.replace(/</g, '\\u003c');
+    return buildPlotDocument(`
+  <div class="plot-container" style="width:100%; min-height:400px; background:#1a1a2e; border-radius:8px; padding:10px;">
+    <div id="plot" class="plotly-graph-div"></div>
+  </div>
+  <script type="application/json" id="plot-data">${safeJson}</script>
+  <script src="https://cdn.plot.ly/plotly-${version}.min.js" charset="utf-8"></script>
+  <script>
+    const payload = JSON.parse(document.getElementById('plot-data').textContent);
+    Plotly.newPlot('plot', payload.figure.data, payload.figure.layout, { responsive: true });
+  </script>`);
+  };
+  
   return (
     <div className="my-3 mx-4">
       {toolCalls.map((call, idx) => {
         // Find the matching result for THIS specific tool call
         const toolResult = getResultForToolCall(call.id);
         const isPlot = toolResult && isPlotResult(toolResult.content);
-        const plotHtml = isPlot ? extractPlotHtml(toolResult.content) : null;
+        const plotJson = isPlot ? extractPlotJson(toolResult.content) : null;
+        const plotHtml = isPlot && !plotJson ? extractPlotHtml(toolResult.content) : null;
+        const plotDocument = plotJson
+          ? buildPlotJsonDocument(plotJson)
+          : plotHtml ? buildPlotDocument(plotHtml) : null;
         
         return (
           <div key={call.id || idx} className="tool-call-block rounded-lg p-4 mb-2">
@@ -90,10 +127,10 @@ export default function ToolCallDisplay({ toolCallMessage, toolResults }: ToolCa
             {toolResult && (
               <div>
                 <div className="text-xs text-gray-500 mb-1">Result:</div>
-                {plotHtml ? (
+                {plotDocument ? (
                   // Render plot in iframe - scripts execute inside iframe
                   <iframe
-                    srcDoc={buildPlotDocument(plotHtml)}
+                    srcDoc={plotDocument}
                     className="w-full rounded-lg border-0"
                     style={{ height: '480px', background: 'transparent' }}
                     sandbox="allow-scripts"